@@ -0,0 +1,55 @@
+"""Parser de valores monetários.
+
+Converte os valores extraídos das faturas em Decimal numa única passagem,
+aceitando separadores de milhares europeus e anglo-saxónicos
+(1.234,56 / 1,234.56 / 1 234,56 / 1.234) e símbolos ou códigos de moeda.
+"""
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional
+
+AMOUNT_CACHE_SIZE = 4096
+
+# Um único separador que aparece uma só vez é o separador decimal (como antes: "1,5" == 1.5),
+# exceto se vier depois de 1 a 3 algarismos e antes de exatamente 3 (ver parse_amount);
+# com agrupamento de milhares, o separador decimal tem de ser diferente do de milhares
+_AMOUNT_RE = re.compile(r"""
+    \s*(?P<sign>[-+])?\s*
+    (?:[€$£¥]|[A-Za-z]{3})?\s*
+    (?P<inner_sign>[-+])?\s*
+    (?P<integer>\d+|\d{1,3}(?P<group>[.,'\s])\d{3}(?:(?P=group)\d{3})*)
+    (?:(?P<decimal>[.,])(?P<fraction>\d+))?
+    \s*(?:[€$£¥]|[A-Za-z]{3})?\s*
+    (?P<trailing_sign>-)?\s*
+""", re.VERBOSE)
+
+
+@lru_cache(maxsize=AMOUNT_CACHE_SIZE)
+def parse_amount(value: str) -> Optional[Decimal]:
+    """Converte o texto num Decimal; retorna None se não for um valor monetário válido"""
+    match = _AMOUNT_RE.fullmatch(value)
+    if match is None:
+        return None
+
+    group, decimal_sep = match.group('group'), match.group('decimal')
+    if group is not None and group == decimal_sep:
+        return None
+    signs = [s for s in (match.group('sign'), match.group('inner_sign'), match.group('trailing_sign')) if s]
+    if len(signs) > 1:
+        return None
+
+    integer, fraction = match.group('integer'), match.group('fraction')
+    if group is not None:
+        integer = integer.replace(group, '')
+    elif decimal_sep and len(fraction) == 3 and len(integer) <= 3 and integer[0] != '0':
+        # "$1,000" e "1.234 €" são milhares, não 1.000 e 1.234 ("0,500" continua a ser 0.5)
+        integer, decimal_sep = integer + fraction, None
+    number = f"{integer}.{fraction}" if decimal_sep else integer
+    return Decimal(f"-{number}" if signs == ['-'] else number)
+
+
+def parse_amounts(values: Iterable[Any]) -> List[Optional[Decimal]]:
+    """Converte uma coluna inteira de valores (None ou vazio -> None)"""
+    parse = parse_amount
+    return [parse(value) if isinstance(value, str) and value else None for value in values]
@@ -0,0 +1,180 @@
+"""Verificações de consistência vetorizadas (NumPy) para lotes de faturas.
+
+Recebe colunas de valores líquidos, IVA, totais e taxas de IVA e calcula, para
+o lote inteiro de uma só vez, um conjunto de flags por fatura. As flags podem
+depois ser convertidas em ValidationResult por fatura.
+"""
+from decimal import Decimal
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from amount_parser import parse_amounts
+from invoice_validator import MODEL_TO_FORM, ValidationResult, ValidationStatus
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Flags por fatura (bitmask uint8)
+FLAG_TOTAL_MISMATCH = 1
+FLAG_NEGATIVE_NET = 2
+FLAG_NEGATIVE_VAT = 4
+FLAG_NEGATIVE_TOTAL = 8
+FLAG_ZERO_TOTAL = 16
+FLAG_IMPLAUSIBLE_VAT_RATE = 32
+
+# Taxa normal mais alta na UE (Hungria); acima disto a taxa é considerada implausível
+MAX_VAT_RATE = 27.0
+# Diferença máxima (pontos percentuais) entre a taxa indicada e a taxa implícita IVA/líquido
+VAT_RATE_TOLERANCE = 0.5
+# Casas decimais máximas na comparação: mais do que isto deixaria de caber exato num float64
+MAX_DECIMAL_PLACES = 6
+
+
+def _require_numpy() -> None:
+    if not NUMPY_AVAILABLE:
+        raise ImportError("As verificações vetorizadas requerem o pacote numpy (pip install numpy)")
+
+
+class AmountColumns(NamedTuple):
+    """Colunas de valores já convertidas: inteiros (em float64) em unidades de 10**-places; em falta -> NaN"""
+    net: "np.ndarray"
+    vat: "np.ndarray"
+    total: "np.ndarray"
+    places: int
+
+
+def _parse_column(column: Any) -> Tuple["np.ndarray", int]:
+    """Converte uma coluna em float64 e retorna-a com o número de casas decimais a respeitar"""
+    if not isinstance(column, np.ndarray):
+        column = list(column)
+        if not all(isinstance(v, (int, float)) for v in column):
+            return _parse_text_column(column)
+    array = np.asarray(column)
+    if array.dtype.kind not in "iuf":
+        return _parse_text_column(array.tolist())
+    # Um float não guarda as casas decimais escritas: compara-se ao cêntimo
+    return array.astype(np.float64), 2
+
+
+def _parse_text_column(values: List[Any]) -> Tuple["np.ndarray", int]:
+    # Texto ou Decimal: passa pelo parser de valores (uma passagem pela coluna)
+    amounts = parse_amounts([str(v) if v is not None and not isinstance(v, str) else v for v in values])
+    present = [amount for amount in amounts if amount is not None]
+    places = -min((amount.as_tuple().exponent for amount in present), default=0)
+    floats = np.array([np.nan if amount is None else float(amount) for amount in amounts], dtype=np.float64)
+    return floats, max(0, places)
+
+
+def amount_columns(net: Any, vat: Any, total: Any) -> AmountColumns:
+    """Converte as colunas de valores (números, Decimal ou texto) numa escala comum.
+
+    Valores em texto são comparados com as casas decimais que têm, como na regra decimal
+    do InvoiceValidator (10.005 + 0 não confere com 10.01); só os floats são arredondados
+    ao cêntimo.
+    """
+    _require_numpy()
+    columns = [_parse_column(column) for column in (net, vat, total)]
+    places = min(max(2, *(places for _, places in columns)), MAX_DECIMAL_PLACES)
+    # Inteiros em float64 são exatos até 2**53, pelo que a soma na escala comum é exata
+    net_units, vat_units, total_units = (np.rint(array * 10 ** places) for array, _ in columns)
+    return AmountColumns(net_units, vat_units, total_units, places)
+
+
+def check_consistency(net: Any, vat: Any, total: Any, vat_rate: Optional[Any] = None) -> "np.ndarray":
+    """Calcula as flags de consistência de todas as faturas do lote numa só passagem"""
+    return consistency_flags(amount_columns(net, vat, total), vat_rate)
+
+
+def consistency_flags(columns: AmountColumns, vat_rate: Optional[Any] = None) -> "np.ndarray":
+    """Como check_consistency, para colunas já convertidas por amount_columns"""
+    _require_numpy()
+    net, vat, total = columns.net, columns.vat, columns.total
+    flags = np.zeros(len(total), dtype=np.uint8)
+
+    # Comparações com NaN dão sempre False, por isso valores em falta nunca geram flags
+    flags[net < 0] |= FLAG_NEGATIVE_NET
+    flags[vat < 0] |= FLAG_NEGATIVE_VAT
+    flags[total < 0] |= FLAG_NEGATIVE_TOTAL
+    flags[total == 0] |= FLAG_ZERO_TOTAL
+    expected = net + vat
+    flags[(expected != total) & ~np.isnan(expected + total)] |= FLAG_TOTAL_MISMATCH
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        implied_rate = np.where(net > 0, vat / net * 100, np.nan)
+    if vat_rate is None:
+        implausible = (implied_rate < 0) | (implied_rate > MAX_VAT_RATE)
+    else:
+        rate = np.asarray(vat_rate, dtype=np.float64)
+        implausible = (rate < 0) | (rate > MAX_VAT_RATE) | (np.abs(implied_rate - rate) > VAT_RATE_TOLERANCE)
+    flags[implausible] |= FLAG_IMPLAUSIBLE_VAT_RATE
+
+    return flags
+
+
+def flagged_indices(flags: "np.ndarray") -> "np.ndarray":
+    """Índices das faturas com pelo menos uma flag"""
+    _require_numpy()
+    return np.flatnonzero(flags)
+
+
+_VALID = ValidationResult.intern(ValidationStatus.GOOD, "Válido")
+_NEGATIVE = ValidationResult.intern(ValidationStatus.BAD, "Valor não pode ser negativo")
+_ZERO = ValidationResult.intern(ValidationStatus.WARNING, "Valor zero")
+_IMPLAUSIBLE_RATE = ValidationResult.intern(ValidationStatus.WARNING, "Taxa de IVA implausível")
+
+
+def flags_to_results(flags: "np.ndarray", columns: AmountColumns) -> List[Dict[str, ValidationResult]]:
+    """Converte as flags em resultados por fatura para os campos de valores (chaves do formulário).
+
+    columns são as colunas usadas para calcular as flags (amount_columns), sem as converter
+    de novo. Valores em falta ou inválidos ficam de fora: esses casos são tratados pelo
+    InvoiceValidator.
+    """
+    _require_numpy()
+    expected_units = columns.net + columns.vat
+    net_present = (~np.isnan(columns.net)).tolist()
+    vat_present = (~np.isnan(columns.vat)).tolist()
+    total_present = (~np.isnan(columns.total)).tolist()
+    net_key = MODEL_TO_FORM['NetDocumentAmount']
+    vat_key = MODEL_TO_FORM['VATAmount']
+    total_key = MODEL_TO_FORM['TotalDocumentAmount']
+
+    results = []
+    for index, flag in enumerate(flags.tolist()):
+        invoice_results = {}
+        if net_present[index]:
+            invoice_results[net_key] = _NEGATIVE if flag & FLAG_NEGATIVE_NET else _VALID
+        if vat_present[index]:
+            if flag & FLAG_NEGATIVE_VAT:
+                invoice_results[vat_key] = _NEGATIVE
+            elif flag & FLAG_IMPLAUSIBLE_VAT_RATE:
+                invoice_results[vat_key] = _IMPLAUSIBLE_RATE
+            else:
+                invoice_results[vat_key] = _VALID
+        if total_present[index]:
+            if flag & FLAG_NEGATIVE_TOTAL:
+                invoice_results[total_key] = _NEGATIVE
+            elif flag & FLAG_ZERO_TOTAL:
+                invoice_results[total_key] = _ZERO
+            elif flag & FLAG_TOTAL_MISMATCH:
+                # Decimal exato, formatado como na regra do InvoiceValidator
+                expected_total = Decimal(int(expected_units[index])).scaleb(-columns.places)
+                invoice_results[total_key] = ValidationResult(
+                    ValidationStatus.WARNING, f"Total não confere (esperado: {expected_total:.2f})"
+                )
+            else:
+                invoice_results[total_key] = _VALID
+        results.append(invoice_results)
+
+    return results
+
+
+def check_records(records: Sequence[Dict[str, Any]]) -> List[Dict[str, ValidationResult]]:
+    """Atalho: extrai as colunas de uma lista de faturas (chaves do modelo) e retorna os resultados"""
+    net = [record.get('NetDocumentAmount') or None for record in records]
+    vat = [record.get('VATAmount') or None for record in records]
+    total = [record.get('TotalDocumentAmount') or None for record in records]
+    columns = amount_columns(net, vat, total)
+    return flags_to_results(consistency_flags(columns), columns)
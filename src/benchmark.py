@@ -0,0 +1,464 @@
+"""Benchmarks do validador de faturas.
+
+Uso (a partir da pasta src):
+    python benchmark.py            # corre todos os benchmarks
+    python benchmark.py batch      # apenas o benchmark indicado
+"""
+import gc
+import random
+import re
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field, PydanticDeprecatedSince20, validator
+
+from amount_parser import parse_amount, parse_amounts
+from invoice_validator import (FORM_TO_MODEL, INVOICE_LIST_ADAPTER, InvoiceData, InvoiceValidator, ValidationCache,
+                               ValidationResult, ValidationStatus, disable_profiling, enable_profiling)
+
+SAMPLE_DOCUMENT_TYPES = ['Invoice', 'Factura', 'Receipt', 'Nota de Crédito', 'INVO']
+SAMPLE_DATES = ['2024-01-15', '15/01/2024', '2023/12/31', '01-06-2024', '2024-13-01']
+SAMPLE_AMOUNTS = ['100,00', '100.00', '0', '-5', 'abc']
+SAMPLE_TAX_IDS = ['501964843', '123456789', '999999990', '12345']
+SAMPLE_CURRENCIES = ['EUR', 'usd', 'GBP', 'XYZ']
+
+
+def generate_records(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Gera faturas sintéticas com uma mistura de valores válidos e inválidos"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        records.append({
+            "DocumentType": rng.choice(SAMPLE_DOCUMENT_TYPES),
+            "DocumentID": f"FT {i}",
+            "DocumentDate": rng.choice(SAMPLE_DATES),
+            "Language": "pt",
+            "CurrencyCode": rng.choice(SAMPLE_CURRENCIES),
+            "TotalDocumentAmount": "123,00",
+            "NetDocumentAmount": rng.choice(SAMPLE_AMOUNTS),
+            "VATAmount": "23,00",
+            "VendorName": "Fornecedor Exemplo, Lda",
+            "VendorTaxID": rng.choice(SAMPLE_TAX_IDS),
+            "VendorCountryCode": "PT",
+            "CustomerName": "Cliente Exemplo, SA",
+            "CustomerTaxID": rng.choice(SAMPLE_TAX_IDS),
+            "CustomerCountryCode": "PT",
+        })
+    return records
+
+
+def _timed(func: Callable[[], Any], repeat: int = 3) -> float:
+    """Devolve o melhor tempo (segundos) de várias execuções"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_batch(count: int = 10000) -> None:
+    """Compara validate_all_fields (registo a registo) com validate_many"""
+    records = generate_records(count)
+
+    def per_record():
+        return [InvoiceValidator.validate_all_fields(record) for record in records]
+
+    def batch():
+        return InvoiceValidator.validate_many(records)
+
+    # Confirmar que ambos os caminhos produzem os mesmos estados
+    for single, many in zip(per_record(), batch()):
+        assert {k: v.status for k, v in single.items()} == {k: v.status for k, v in many.items()}
+
+    cache = ValidationCache()
+
+    def batch_cached():
+        cache.clear()
+        return InvoiceValidator.validate_many(records, cache=cache)
+
+    per_record_time = _timed(per_record)
+    batch_time = _timed(batch)
+    cached_time = _timed(batch_cached)
+    print(f"[batch] {count} faturas")
+    print(f"  validate_all_fields: {count / per_record_time:10.0f} faturas/s")
+    print(f"  validate_many:       {count / batch_time:10.0f} faturas/s ({per_record_time / batch_time:.1f}x)")
+    print(f"  validate_many+cache: {count / cached_time:10.0f} faturas/s ({per_record_time / cached_time:.1f}x, "
+          f"hit rate {cache.hit_rate:.0%})")
+
+
+# A referência mantém de propósito os validadores v1
+warnings.filterwarnings("ignore", category=PydanticDeprecatedSince20, module=__name__)
+
+
+class LegacyInvoiceData(BaseModel):
+    """Cópia do modelo original (validadores estilo v1, tudo Optional[str]) usada como referência"""
+    DocumentType: Optional[str] = Field(default="", description="Tipo do documento")
+    DocumentID: Optional[str] = Field(default="", description="ID do documento")
+    DocumentDate: Optional[str] = Field(default="", description="Data do documento")
+    Language: Optional[str] = Field(default="", description="Idioma do documento")
+    
+    CurrencyCode: Optional[str] = Field(default="", description="Código da moeda")
+    TotalDocumentAmount: Optional[str] = Field(default="", description="Valor total")
+    NetDocumentAmount: Optional[str] = Field(default="", description="Valor líquido")
+    VATAmount: Optional[str] = Field(default="", description="Valor do IVA")
+    
+    VendorName: Optional[str] = Field(default="", description="Nome do fornecedor")
+    VendorTaxID: Optional[str] = Field(default="", description="NIF do fornecedor")
+    VendorCountryCode: Optional[str] = Field(default="", description="País do fornecedor")
+    
+    CustomerName: Optional[str] = Field(default="", description="Nome do cliente")
+    CustomerTaxID: Optional[str] = Field(default="", description="NIF do cliente")
+    CustomerCountryCode: Optional[str] = Field(default="", description="País do cliente")
+
+    @validator('DocumentDate')
+    def validate_date(cls, v):
+        if not v or v.strip() == "":
+            return v
+        
+        date_formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']
+        for fmt in date_formats:
+            try:
+                datetime.strptime(v.strip(), fmt)
+                return v
+            except ValueError:
+                continue
+        
+        raise ValueError(f"Data inválida: {v}")
+
+    @validator('CurrencyCode')
+    def validate_currency(cls, v):
+        if not v or v.strip() == "":
+            return v
+        
+        valid_currencies = ['EUR', 'USD', 'GBP', 'BRL', 'JPY', 'CHF', 'CAD', 'AUD']
+        if v.upper() not in valid_currencies:
+            raise ValueError(f"Código de moeda inválido: {v}")
+        
+        return v.upper()
+
+    @validator('TotalDocumentAmount', 'NetDocumentAmount', 'VATAmount')
+    def validate_amounts(cls, v):
+        if not v or v.strip() == "":
+            return v
+        
+        cleaned = re.sub(r'[€$£¥\s]', '', v.strip())
+        cleaned = cleaned.replace(',', '.')
+        
+        try:
+            float(cleaned)
+            return cleaned
+        except ValueError:
+            raise ValueError(f"Valor monetário inválido: {v}")
+
+    @validator('VendorTaxID', 'CustomerTaxID')
+    def validate_tax_id(cls, v):
+        if not v or v.strip() == "":
+            return v
+        
+        cleaned = re.sub(r'[^\d]', '', v)
+        if len(cleaned) != 9:
+            raise ValueError(f"NIF deve ter 9 dígitos: {v}")
+        
+        return cleaned
+
+
+def legacy_validate_field(field_name: str, value: str, invoice_data: Dict[str, Any]) -> ValidationResult:
+    """Cópia da implementação original (cadeia if/elif) usada como referência"""
+    if not value or value.strip() == "":
+        if field_name in ['DocumentID', 'DocumentDate', 'VendorName', 'CustomerName']:
+            return ValidationResult(ValidationStatus.BAD, "Campo obrigatório vazio")
+        else:
+            return ValidationResult(ValidationStatus.WARNING, "Campo vazio ")
+    
+    try:
+        temp_data = {field_name: value}
+        temp_invoice = LegacyInvoiceData(**temp_data)
+        
+        if field_name == 'DocumentType':
+            valid_types = ['Invoice', 'Factura', 'Receipt', 'Recibo', 'Credit Note', 'Nota de Crédito']
+            if value not in valid_types:
+                return ValidationResult(ValidationStatus.WARNING, f"Tipo não reconhecido: {value}")
+        
+        elif field_name == 'DocumentDate':
+            try:
+                date_formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']
+                parsed_date = None
+                for fmt in date_formats:
+                    try:
+                        parsed_date = datetime.strptime(value.strip(), fmt)
+                        break
+                    except ValueError:
+                        continue
+                
+                if parsed_date:
+                    now = datetime.now()
+                    if parsed_date > now:
+                        return ValidationResult(ValidationStatus.WARNING, "Data no futuro")
+                    elif (now - parsed_date).days > 365 * 5:
+                        return ValidationResult(ValidationStatus.WARNING, "Data muito antiga")
+            except:
+                pass
+        
+        elif field_name in ['TotalDocumentAmount', 'NetDocumentAmount', 'VATAmount']:
+            try:
+                amount = float(value.replace(',', '.'))
+                if amount < 0:
+                    return ValidationResult(ValidationStatus.BAD, "Valor não pode ser negativo")
+                elif amount == 0:
+                    return ValidationResult(ValidationStatus.WARNING, "Valor zero")
+                
+                if field_name == 'TotalDocumentAmount' and 'NetDocumentAmount' in invoice_data and 'VATAmount' in invoice_data:
+                    try:
+                        net = float(invoice_data['NetDocumentAmount'].replace(',', '.'))
+                        vat = float(invoice_data['VATAmount'].replace(',', '.'))
+                        expected_total = net + vat
+                        if abs(amount - expected_total) > 0.01:
+                            return ValidationResult(ValidationStatus.WARNING, f"Total não confere (esperado: {expected_total:.2f})")
+                    except:
+                        pass
+            
+            except ValueError:
+                return ValidationResult(ValidationStatus.BAD, "Formato de valor inválido")
+        
+        elif field_name in ['VendorTaxID', 'CustomerTaxID']:
+            cleaned = re.sub(r'[^\d]', '', value)
+            if len(cleaned) != 9:
+                return ValidationResult(ValidationStatus.BAD, "NIF deve ter 9 dígitos")
+            
+            if not InvoiceValidator._validate_portuguese_nif(cleaned):
+                return ValidationResult(ValidationStatus.BAD, "NIF inválido (dígito de controle)")
+        
+        elif field_name == 'CurrencyCode':
+            valid_currencies = ['EUR', 'USD', 'GBP', 'BRL', 'JPY', 'CHF', 'CAD', 'AUD']
+            if value.upper() not in valid_currencies:
+                return ValidationResult(ValidationStatus.WARNING, f"Moeda não reconhecida: {value}")
+        
+        return ValidationResult(ValidationStatus.GOOD, "Válido")
+        
+    except ValueError as e:
+        return ValidationResult(ValidationStatus.BAD, str(e))
+    except Exception as e:
+        return ValidationResult(ValidationStatus.WARNING, f"Erro na validação: {str(e)}")
+
+
+def bench_fields(count: int = 5000) -> None:
+    """Latência por campo: cadeia if/elif original vs tabela de regras pré-compilada"""
+    records = generate_records(count)
+    print(f"[fields] {count} valores por campo (µs por chamada)")
+    for model_key in FORM_TO_MODEL.values():
+        values = [(record[model_key], record) for record in records]
+
+        # As regras evoluíram desde a versão original (datas ISO, valores com milhares, NIF por país,
+        # códigos de tipo do prompt), por isso mostra-se quantos estados mudaram em vez de os exigir iguais
+        changed = sum(legacy_validate_field(model_key, v, r).status != InvoiceValidator.validate_field(model_key, v, r).status
+                      for v, r in values)
+
+        legacy_time = _timed(lambda: [legacy_validate_field(model_key, v, r) for v, r in values])
+        current_time = _timed(lambda: [InvoiceValidator.validate_field(model_key, v, r) for v, r in values])
+        # Sem o custo do modelo Pydantic, para isolar o custo das regras
+        rules_time = _timed(lambda: [InvoiceValidator._validate_field(model_key, v, r, check_model=False) for v, r in values])
+        print(f"  {model_key:<22} original {legacy_time / count * 1e6:7.2f}  "
+              f"tabela {current_time / count * 1e6:7.2f}  só regras {rules_time / count * 1e6:7.2f}  "
+              f"estados alterados {changed}")
+
+
+def bench_amounts(count: int = 100000) -> None:
+    """Conversão de uma coluna de valores: float(replace) original vs parse_amounts (Decimal)"""
+    rng = random.Random(42)
+    # (separador de milhares, separador decimal, prefixo)
+    formats = [(".", ",", ""), (",", ".", ""), (" ", ",", ""), ("", ",", "€ "), ("", ",", ""), ("", ".", "")]
+
+    def amount(thousands: str, decimal: str, prefix: str) -> str:
+        units = f"{rng.randrange(1000000):,}".replace(",", thousands)
+        return f"{prefix}{units}{decimal}{rng.randrange(100):02d}"
+
+    column = [amount(*rng.choice(formats)) for _ in range(count)]
+
+    def legacy(values):
+        parsed = []
+        for value in values:
+            try:
+                parsed.append(float(value.replace(',', '.')))
+            except ValueError:
+                parsed.append(None)
+        return parsed
+
+    def cold(values):
+        # Cache vazia em cada execução
+        parse_amount.cache_clear()
+        return parse_amounts(values)
+
+    # O original só é comparável nos valores que consegue converter
+    legacy_column = [value for value, amount in zip(column, legacy(column)) if amount is not None]
+    legacy_time = _timed(lambda: legacy(legacy_column))
+    subset_time = _timed(lambda: cold(legacy_column))
+    column_time = _timed(lambda: cold(column))
+    print(f"[amounts] {count} valores, {len(set(column))} distintos")
+    print(f"  float(replace):  {len(legacy_column) / legacy_time:12.0f} valores/s "
+          f"(só os {len(legacy_column)} que converte; {count - len(legacy_column)} falhados)")
+    print(f"  parse_amounts:   {len(legacy_column) / subset_time:12.0f} valores/s (os mesmos valores)")
+    print(f"  parse_amounts:   {count / column_time:12.0f} valores/s "
+          f"(coluna inteira, {cold(column).count(None)} falhados)")
+
+
+def bench_consistency(count: int = 1000000) -> None:
+    """Verificação líquido + IVA == total: regra por fatura vs motor vetorizado (NumPy)"""
+    import batch_consistency
+    if not batch_consistency.NUMPY_AVAILABLE:
+        print("[consistency] numpy não instalado, benchmark ignorado")
+        return
+    import numpy as np
+
+    rng = np.random.default_rng(42)
+    net = np.round(rng.uniform(1, 10000, count), 2)
+    vat = np.round(net * 0.23, 2)
+    total = net + vat
+    total[::97] += 1  # alguns totais inconsistentes
+
+    sample = min(count, 100000)
+    records = [{"NetDocumentAmount": f"{n:.2f}", "VATAmount": f"{v:.2f}", "TotalDocumentAmount": f"{t:.2f}"}
+               for n, v, t in zip(net[:sample], vat[:sample], total[:sample])]
+    per_invoice_time = _timed(lambda: [InvoiceValidator._validate_field(
+        "TotalDocumentAmount", record["TotalDocumentAmount"], record, check_model=False) for record in records], repeat=1)
+    flags_time = _timed(lambda: batch_consistency.check_consistency(net, vat, total, np.full(count, 23.0)))
+    columns = batch_consistency.amount_columns(net, vat, total)
+    flags = batch_consistency.consistency_flags(columns)
+    results_time = _timed(lambda: batch_consistency.flags_to_results(flags, columns), repeat=1)
+    # Texto, como vem da extração: o parser de valores entra na conta
+    text_time = _timed(lambda: batch_consistency.check_records(records), repeat=1)
+
+    # Os dois motores têm de concordar no total, incluindo valores com mais de duas casas decimais
+    check = records[:1000] + [{"NetDocumentAmount": "10.005", "VATAmount": "0", "TotalDocumentAmount": "10.01"},
+                              {"NetDocumentAmount": "10.005", "VATAmount": "0", "TotalDocumentAmount": "10.005"}]
+    total_key = batch_consistency.MODEL_TO_FORM["TotalDocumentAmount"]
+    for record, results in zip(check, batch_consistency.check_records(check)):
+        single = InvoiceValidator._validate_field("TotalDocumentAmount", record["TotalDocumentAmount"], record,
+                                                  check_model=False)
+        assert (single.status, single.message) == (results[total_key].status, results[total_key].message), record
+    print(f"[consistency] {count} faturas")
+    print(f"  regra por fatura:      {sample / per_invoice_time:12.0f} faturas/s")
+    print(f"  check_consistency:     {count / flags_time:12.0f} faturas/s "
+          f"({np.count_nonzero(flags & batch_consistency.FLAG_TOTAL_MISMATCH)} totais inconsistentes)")
+    print(f"  + flags_to_results:    {count / (flags_time + results_time):12.0f} faturas/s")
+    print(f"  check_records (texto): {sample / text_time:12.0f} faturas/s")
+
+
+# Números válidos e inválidos (dígito de controlo errado) por país
+SAMPLE_TAX_IDS_BY_COUNTRY = {
+    'PT': ['501964843', '501964844', 'PT 501 964 843'],
+    'ES': ['ESB58378431', '12345678Z', 'X1234567L', 'ES12345678A'],
+    'FR': ['FR40303265045', 'FR41303265045', 'FRK7399859412'],
+    'NL': ['NL004495445B01', 'NL004495446B01'],
+    'DE': ['DE136695976', 'DE136695978'],
+    'IT': ['IT00743110157', 'IT00743110158'],
+}
+
+
+def bench_tax_ids(count: int = 100000) -> None:
+    """Débito da validação de NIF/VAT por país, em lote (validate_tax_ids)"""
+    print(f"[tax_ids] {count} NIF por país")
+    for country, samples in SAMPLE_TAX_IDS_BY_COUNTRY.items():
+        column = [samples[i % len(samples)] for i in range(count)]
+        countries = [country] * count
+        elapsed = _timed(lambda: InvoiceValidator.validate_tax_ids(column, countries))
+        valid = sum(r.status == ValidationStatus.GOOD for r in InvoiceValidator.validate_tax_ids(column, countries))
+        print(f"  {country}: {count / elapsed:12.0f} NIF/s ({valid} válidos)")
+
+
+def bench_memory(count: int = 100000) -> None:
+    """Memória ocupada pelos resultados de um lote: lista de dicionários vs CompactResults"""
+    records = generate_records(count)
+    print(f"[memory] resultados de {count} faturas")
+    InvoiceValidator.validate_many(records)  # aquecer as caches dos parsers antes de medir
+    for label, compact in (("lista de dicionários", False), ("CompactResults", True)):
+        gc.collect()
+        tracemalloc.start()
+        results = InvoiceValidator.validate_many(records, compact=compact)
+        # Só o que continua vivo: lixo por recolher (ciclos) não conta como memória dos resultados
+        gc.collect()
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {label:<22} {size / 1024 / 1024:8.1f} MiB (pico {peak / 1024 / 1024:.1f} MiB)")
+        del results
+
+
+def bench_parallel(count: int = 200000, chunk_size: int = 2000) -> None:
+    """Escalabilidade de validate_parallel com o número de processos"""
+    import os
+    records = generate_records(count)
+    serial_time = _timed(lambda: InvoiceValidator.validate_many(records, compact=True), repeat=1)
+    print(f"[parallel] {count} faturas, blocos de {chunk_size}")
+    print(f"  validate_many (1 processo): {count / serial_time:10.0f} faturas/s")
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        start = time.perf_counter()
+        _, timings = InvoiceValidator.validate_parallel(records, workers=workers, chunk_size=chunk_size)
+        elapsed = time.perf_counter() - start
+        busiest = max(timing["seconds"] for timing in timings.values())
+        print(f"  {workers:2d} processos: {count / elapsed:10.0f} faturas/s "
+              f"({serial_time / elapsed:.1f}x, processo mais ocupado {busiest:.2f}s)")
+        workers *= 2
+
+
+def bench_model(count: int = 50000) -> None:
+    """Construção do modelo: original (v1, str) vs InvoiceData v2 vs TypeAdapter(List[InvoiceData])"""
+    records = [{key: value for key, value in record.items() if key != "DocumentType"}
+               for record in generate_records(count)]
+    for record in records:
+        # Só valores válidos, para medir o caminho sem erros
+        record.update(DocumentDate="2024-01-15", NetDocumentAmount="100,00", CurrencyCode="EUR",
+                      VendorTaxID="501964843", CustomerTaxID="501964843")
+
+    legacy_time = _timed(lambda: [LegacyInvoiceData(**record) for record in records])
+    model_time = _timed(lambda: [InvoiceData(**record) for record in records])
+    adapter_time = _timed(lambda: INVOICE_LIST_ADAPTER.validate_python(records))
+    print(f"[model] {count} faturas válidas")
+    print(f"  LegacyInvoiceData (v1):       {count / legacy_time:10.0f} faturas/s")
+    print(f"  InvoiceData (v2, tipado):     {count / model_time:10.0f} faturas/s ({legacy_time / model_time:.1f}x)")
+    print(f"  TypeAdapter(List[...]):       {count / adapter_time:10.0f} faturas/s ({legacy_time / adapter_time:.1f}x)")
+
+
+def bench_profiling(count: int = 10000) -> None:
+    """Custo do profiling das regras: desligado vs ligado, e as etapas mais lentas"""
+    records = generate_records(count)
+    disable_profiling()
+    off_time = _timed(lambda: InvoiceValidator.validate_many(records))
+    enable_profiling(sample_every=20)
+    sampled_time = _timed(lambda: InvoiceValidator.validate_many(records))
+    profiler = enable_profiling()
+    on_time = _timed(lambda: InvoiceValidator.validate_many(records))
+    disable_profiling()
+
+    print(f"[profiling] {count} faturas")
+    print(f"  desligado:          {count / off_time:10.0f} faturas/s")
+    print(f"  ligado (1 em 20):   {count / sampled_time:10.0f} faturas/s ({sampled_time / off_time - 1:+.0%})")
+    print(f"  ligado (todas):     {count / on_time:10.0f} faturas/s ({on_time / off_time - 1:+.0%})")
+    stages = [(metrics["sum"], field_name, stage, metrics["mean"])
+              for field_name, field_stages in profiler.to_dict().items()
+              for stage, metrics in field_stages.items() if stage != "total"]
+    for total, field_name, stage, mean in sorted(stages, reverse=True)[:5]:
+        print(f"  {field_name:<20} {stage:<14} {total * 1e3:8.1f} ms  ({mean * 1e6:.2f} µs/chamada)")
+
+
+BENCHMARKS = {
+    "batch": bench_batch,
+    "fields": bench_fields,
+    "amounts": bench_amounts,
+    "consistency": bench_consistency,
+    "tax_ids": bench_tax_ids,
+    "memory": bench_memory,
+    "parallel": bench_parallel,
+    "model": bench_model,
+    "profiling": bench_profiling,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
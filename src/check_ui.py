@@ -0,0 +1,58 @@
+"""Verificação rápida (sem Streamlit nem servidor ADK) dos módulos da UI e da extração.
+
+A UI só corre dentro do Streamlit, pelo que um nome por importar (NameError) só
+aparece quando alguém abre a página certa. Este script analisa o código com o
+pyflakes (pip install pyflakes) e falha se encontrar nomes indefinidos; os
+restantes avisos do pyflakes (imports por usar, etc.) são só mostrados.
+
+Uso (a partir da pasta src):
+    python check_ui.py                # ui5.py e os módulos que usa
+    python check_ui.py outro.py ...   # só os ficheiros indicados
+"""
+import ast
+import sys
+
+try:
+    from pyflakes import checker, messages
+    PYFLAKES_AVAILABLE = True
+except ImportError:
+    PYFLAKES_AVAILABLE = False
+
+DEFAULT_FILES = ('ui5.py', 'styles.py', 'extraction.py', 'extraction_jobs.py', 'extraction_cache.py',
+                 'response_parser.py', 'resilience.py', 'scheduler.py', 'invoice_validator.py')
+
+if PYFLAKES_AVAILABLE:
+    # Erros que rebentam em tempo de execução
+    FATAL_MESSAGES = (messages.UndefinedName, messages.UndefinedLocal, messages.UndefinedExport,
+                      messages.DuplicateArgument)
+
+
+def check_file(path: str) -> int:
+    """Mostra os avisos do pyflakes para o ficheiro e retorna o número de erros fatais"""
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source, filename=path)
+    except SyntaxError as e:
+        print(f"{path}:{e.lineno}: erro de sintaxe: {e.msg}")
+        return 1
+    fatal = 0
+    for message in sorted(checker.Checker(tree, filename=path).messages, key=lambda m: m.lineno):
+        is_fatal = isinstance(message, FATAL_MESSAGES)
+        fatal += is_fatal
+        print(f"{'ERRO' if is_fatal else 'aviso'} {message}")
+    return fatal
+
+
+def main(argv=None) -> int:
+    if not PYFLAKES_AVAILABLE:
+        print("A verificação requer o pacote pyflakes (pip install pyflakes)", file=sys.stderr)
+        return 2
+    paths = (argv if argv is not None else sys.argv[1:]) or DEFAULT_FILES
+    fatal = sum(check_file(path) for path in paths)
+    print(f"{len(paths)} ficheiros verificados, {fatal} erros")
+    return 1 if fatal else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""Parser de datas dos documentos.
+
+Reconhece os formatos aceites pelo validador com uma única expressão regular
+(sem tentativas sucessivas de strptime) e guarda os resultados numa cache LRU,
+já que num lote as mesmas datas repetem-se muito.
+"""
+import calendar
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Optional
+
+DATE_CACHE_SIZE = 4096
+
+# ISO 8601 (pedido ao LLM em prompt.py, com hora opcional), dd/mm/aaaa, dd-mm-aaaa e aaaa/mm/dd
+_DATE_RE = re.compile(r"""
+    (?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})
+        (?:[T\ ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?
+  | (?P<dmy_d>\d{1,2})(?P<sep>[/-])(?P<dmy_m>\d{1,2})(?P=sep)(?P<dmy_y>\d{4})
+  | (?P<ymd_y>\d{4})/(?P<ymd_m>\d{1,2})/(?P<ymd_d>\d{1,2})
+""", re.VERBOSE)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_document_date(value: str) -> Optional[date]:
+    """Converte o texto numa data; retorna None se o formato ou a data forem inválidos"""
+    match = _DATE_RE.fullmatch(value.strip())
+    if match is None:
+        return None
+
+    groups = match.groupdict()
+    if groups['iso_y'] is not None:
+        year, month, day = groups['iso_y'], groups['iso_m'], groups['iso_d']
+    elif groups['dmy_y'] is not None:
+        year, month, day = groups['dmy_y'], groups['dmy_m'], groups['dmy_d']
+    else:
+        year, month, day = groups['ymd_y'], groups['ymd_m'], groups['ymd_d']
+
+    year, month, day = int(year), int(month), int(day)
+    if year < 1 or not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(year, month)[1]:
+        return None
+    return date(year, month, day)
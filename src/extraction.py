@@ -0,0 +1,490 @@
+"""Cliente de extração de faturas através do servidor ADK (endpoint /run).
+
+Usado pela UI, tanto para uma fatura como para lotes: em lote, os PDFs são
+enviados em paralelo (threads, já que o trabalho é esperar pelo servidor) e
+cada um usa a sua própria sessão ADK, para que as conversas não se misturem.
+Todos os pedidos passam por um ADKClient, que reutiliza as ligações HTTP, e cada
+extração usa uma sessão nova (SessionManager), apagada no fim.
+"""
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from extraction_cache import ExtractionCache, pdf_digest
+from resilience import CircuitBreaker, RetryPolicy, parse_retry_after
+from response_parser import IncrementalFieldParser
+from scheduler import ExtractionScheduler
+
+# Servidor ADK e agente, os mesmos na UI e nos scripts (process_batch, watch_folder)
+SERVER_URL = os.environ.get("ADK_SERVER_URL", "http://localhost:8000")
+APP_NAME = "invoices"
+USER_ID = "user0"
+# Comprimir os pedidos com gzip (o servidor ADK tem de aceitar Content-Encoding: gzip)
+GZIP_REQUESTS = os.environ.get("ADK_GZIP_REQUESTS", "").lower() in ("1", "true", "yes")
+
+EXTRACTION_INSTRUCTION = "Extract information from invoice"
+DEFAULT_TIMEOUT = 90
+DEFAULT_BATCH_WORKERS = 8
+# Um único servidor ADK: poucos pools, mas ligações suficientes para o lote mais paralelo da UI
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 32
+# Sessões não apagadas (falhas) são removidas ao fim deste tempo; bem acima do timeout de /run
+DEFAULT_SESSION_TTL = 600
+
+
+class ExtractionError(Exception):
+    """Falha na extração de uma fatura; a mensagem é mostrada ao utilizador"""
+
+
+class CircuitOpenError(ExtractionError):
+    """O servidor de processamento falhou repetidamente; o pedido nem chegou a ser enviado"""
+
+
+def build_run_payload(pdf_bytes: bytes, app_name: str, user_id: str, session_id: str) -> Dict[str, Any]:
+    pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+    return {
+        "app_name": app_name, "user_id": user_id, "session_id": session_id,
+        "new_message": {
+            "role": "user",
+            "parts": [{"text": EXTRACTION_INSTRUCTION}, {"inline_data": {"mime_type": "application/pdf", "data": pdf_base64}}]
+        }
+    }
+
+
+def parser_result(parser: IncrementalFieldParser) -> Dict[str, Any]:
+    """Campos recuperados pelo parser no fim da resposta; sem campos nenhuns -> ExtractionError.
+
+    Uma resposta truncada conta com os campos completos recebidos até ao corte (a
+    validação assinala os que faltarem).
+    """
+    fields = parser.finish()
+    if not fields:
+        if parser.complete:
+            raise ExtractionError("Formato de dados inválido extraído da fatura.")
+        raise ExtractionError("Não foi possível extrair dados JSON válidos da fatura.")
+    return fields
+
+
+def parse_extraction_text(text: str) -> Dict[str, Any]:
+    """Extrai os campos (chaves do modelo) do texto de resposta do agente"""
+    parser = IncrementalFieldParser()
+    parser.feed(text)
+    return parser_result(parser)
+
+
+def parse_extraction_response(response_data: Any) -> Dict[str, Any]:
+    """Extrai o objeto JSON do texto da primeira resposta do agente (endpoint /run)"""
+    try:
+        text = response_data[0]['content']['parts'][0]['text']
+    except (KeyError, IndexError, TypeError):
+        raise ExtractionError("Resposta inesperada do servidor de processamento.")
+    return parse_extraction_text(text)
+
+
+def iter_sse_text(lines: Iterable[str]) -> Iterator[str]:
+    """Texto produzido pelo agente num stream SSE do ADK (/run_sse), aos bocados.
+
+    Com streaming, os eventos parciais trazem só o texto novo e o evento final repete a
+    resposta inteira; esse só é usado se não tiver chegado nenhum evento parcial.
+    """
+    received_partial = False
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        event = json.loads(line[len("data:"):])
+        if not isinstance(event, dict):
+            continue
+        if event.get("error"):
+            raise ExtractionError(f"Erro do servidor de processamento: {event['error']}")
+        parts = (event.get("content") or {}).get("parts") or []
+        text = "".join(part.get("text") or "" for part in parts)
+        if not text:
+            continue
+        if event.get("partial"):
+            received_partial = True
+            yield text
+        elif not received_partial:
+            yield text
+
+
+class ADKClient:
+    """Cliente HTTP do servidor ADK, partilhado entre pedidos, reruns e threads.
+
+    Usa uma requests.Session com um pool de ligações keep-alive (no máximo pool_maxsize
+    ligações por host; com pool_block, os pedidos a mais esperam por uma ligação livre em vez
+    de abrir outras). Com gzip_requests=True, os corpos JSON (o PDF em base64) são enviados
+    comprimidos; o servidor tem de aceitar Content-Encoding: gzip.
+
+    Os POST passam pela política de novas tentativas (retry) e pelo circuit breaker (breaker),
+    partilhados por todas as threads que usam o cliente. As extrações passam ainda pelo
+    scheduler (pedidos em curso e pedidos por minuto ao modelo); sem um scheduler indicado,
+    só a concorrência é limitada, a pool_maxsize.
+    """
+
+    def __init__(self, server_url: str, app_name: str, user_id: str, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE, gzip_requests: bool = False,
+                 timeout: float = DEFAULT_TIMEOUT, retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, scheduler: Optional[ExtractionScheduler] = None):
+        self.server_url = server_url.rstrip('/')
+        self.app_name = app_name
+        self.user_id = user_id
+        self.gzip_requests = gzip_requests
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.scheduler = scheduler or ExtractionScheduler(pool_maxsize)
+        self.retries = 0
+        self.retries_by_reason: Dict[str, int] = {}
+        self.retry_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self.http.headers.update({'Content-Type': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+
+    def session_url(self, session_id: str) -> str:
+        return f"{self.server_url}/apps/{self.app_name}/users/{self.user_id}/sessions/{session_id}"
+
+    def post_json(self, url: str, payload: Any, timeout: Optional[float] = None,
+                  stream: bool = False, rate_limited: bool = False) -> requests.Response:
+        """POST de JSON com novas tentativas para erros passageiros (429, 5xx, falhas de ligação).
+
+        A resposta final é retornada tal como veio (o chamador faz raise_for_status); com o
+        circuito aberto lança CircuitOpenError sem contactar o servidor. Com rate_limited=True
+        (pedidos ao modelo), cada tentativa espera pela sua vez no limite de pedidos por minuto.
+        """
+        body = json.dumps(payload).encode('utf-8')
+        headers = None
+        if self.gzip_requests:
+            # Nível 1: quase toda a redução do base64 com uma fração do tempo de CPU
+            body = gzip.compress(body, compresslevel=1)
+            headers = {'Content-Encoding': 'gzip'}
+
+        attempt = 0
+        while True:
+            # O circuito é consultado antes da quota: com ele aberto, o pedido não gasta um token
+            if not self.breaker.allow():
+                raise CircuitOpenError("Servidor de processamento indisponível (várias falhas seguidas); "
+                                       f"nova tentativa dentro de {self.breaker.retry_in():.0f}s.")
+            try:
+                if rate_limited:
+                    self.scheduler.wait_for_token()
+                response = self.http.post(url, data=body, headers=headers, timeout=timeout or self.timeout,
+                                          stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                # Um ReadTimeout significa que o servidor recebeu o pedido: repeti-lo duplicaria a espera
+                if isinstance(e, requests.exceptions.ReadTimeout) or attempt + 1 >= self.retry.max_attempts:
+                    raise
+                self._wait_before_retry(attempt, type(e).__name__)
+                attempt += 1
+                continue
+            except Exception:
+                # Qualquer outro erro (ChunkedEncodingError, ...) também conta como falha; sem isto, um
+                # pedido de teste com o circuito meio aberto deixaria o circuito preso à espera dele
+                self.breaker.record_failure()
+                raise
+
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                # Um 429 é limite de quota, não backend em baixo: não conta para o circuit breaker
+                self.breaker.record_success()
+            if response.status_code not in self.retry.retryable_status_codes \
+                    or attempt + 1 >= self.retry.max_attempts:
+                return response
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            response.close()
+            self._wait_before_retry(attempt, str(response.status_code), retry_after)
+            attempt += 1
+
+    def _wait_before_retry(self, attempt: int, reason: str, retry_after: Optional[float] = None) -> None:
+        delay = self.retry.delay(attempt, retry_after)
+        with self._stats_lock:
+            self.retries += 1
+            self.retries_by_reason[reason] = self.retries_by_reason.get(reason, 0) + 1
+            self.retry_wait_seconds += delay
+        time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Novas tentativas (total, por motivo, tempo de espera), circuit breaker e scheduler"""
+        with self._stats_lock:
+            stats = {
+                "retries": self.retries,
+                "retries_by_reason": dict(self.retries_by_reason),
+                "retry_wait_seconds": self.retry_wait_seconds,
+            }
+        stats["circuit"] = self.breaker.stats()
+        stats["scheduler"] = self.scheduler.stats()
+        return stats
+
+    def check_connection(self) -> None:
+        """Verifica se o servidor responde (lista as sessões do utilizador)"""
+        response = self.http.get(f"{self.server_url}/apps/{self.app_name}/users/{self.user_id}/sessions",
+                                 timeout=self.timeout)
+        response.raise_for_status()
+
+    def create_session(self, session_id: str) -> None:
+        response = self.post_json(self.session_url(session_id), {"state": {}})
+        response.raise_for_status()
+
+    def get_session(self, session_id: str) -> Dict[str, Any]:
+        response = self.http.get(self.session_url(session_id), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def delete_session(self, session_id: str) -> None:
+        response = self.http.delete(self.session_url(session_id), timeout=self.timeout)
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    def extract_invoice(self, pdf_bytes: bytes, session_id: str, stream: bool = False,
+                        on_field: Optional[Callable[[str, Any], None]] = None,
+                        on_context: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, Any]:
+        """Envia o PDF ao agente e retorna os dados extraídos; erros chegam como ExtractionError.
+
+        Com stream=True usa o endpoint SSE (/run_sse) e chama on_field(chave, valor) para cada
+        campo assim que o seu valor chega, antes de a resposta terminar. on_context recebe o
+        tamanho do contexto que a extração deixa na sessão (ver context_size), calculado a
+        partir do pedido e da resposta. A extração ocupa um lugar no scheduler do princípio ao
+        fim (no streaming, até ao último evento).
+        """
+        with self.scheduler.slot() as admitted:
+            if not admitted:
+                raise ExtractionError("Demasiadas extrações em espera; tente novamente dentro de momentos.")
+            return self._extract(pdf_bytes, session_id, stream, on_field, on_context)
+
+    def _extract(self, pdf_bytes: bytes, session_id: str, stream: bool,
+                 on_field: Optional[Callable[[str, Any], None]],
+                 on_context: Optional[Callable[[Dict[str, int]], None]]) -> Dict[str, Any]:
+        payload = build_run_payload(pdf_bytes, self.app_name, self.user_id, session_id)
+        try:
+            if stream:
+                return self._extract_streaming(payload, on_field, on_context)
+            response = self.post_json(f"{self.server_url}/run", payload, rate_limited=True)
+            response.raise_for_status()
+            response_data = response.json()
+            if on_context is not None and isinstance(response_data, list):
+                on_context(run_context_size(payload, response_data))
+        except requests.exceptions.Timeout:
+            raise ExtractionError("Timeout: O servidor demorou muito para responder.")
+        except requests.exceptions.RequestException as e:
+            raise ExtractionError(f"Erro de comunicação com o servidor: {e}")
+        except ValueError as e:
+            raise ExtractionError(f"Erro ao processar JSON da fatura: {e}")
+        return parse_extraction_response(response_data)
+
+    def _extract_streaming(self, payload: Dict[str, Any], on_field: Optional[Callable[[str, Any], None]],
+                           on_context: Optional[Callable[[Dict[str, int]], None]]) -> Dict[str, Any]:
+        parser = IncrementalFieldParser()
+        chunks = []
+        with self.post_json(f"{self.server_url}/run_sse", dict(payload, streaming=True), stream=True,
+                            rate_limited=True) as response:
+            response.raise_for_status()
+            for chunk in iter_sse_text(response.iter_lines(decode_unicode=True)):
+                chunks.append(chunk)
+                for key, value in parser.feed(chunk):
+                    if on_field is not None:
+                        on_field(key, value)
+        if on_context is not None:
+            # Os eventos parciais não ficam na sessão, só o evento final com a resposta inteira
+            final_event = {"content": {"role": "model", "parts": [{"text": "".join(chunks)}]}}
+            on_context(run_context_size(payload, [final_event]))
+        return parser_result(parser)
+
+    def close(self) -> None:
+        self.http.close()
+
+
+def context_size(session: Dict[str, Any]) -> Dict[str, int]:
+    """Tamanho do contexto de uma sessão ADK: eventos, texto e anexos (base64) acumulados"""
+    events = session.get("events") or []
+    text_chars = inline_bytes = 0
+    for event in events:
+        for part in ((event.get("content") or {}).get("parts") or []):
+            text_chars += len(part.get("text") or "")
+            inline_bytes += len((part.get("inline_data") or part.get("inlineData") or {}).get("data") or "")
+    return {"events": len(events), "text_chars": text_chars, "inline_bytes": inline_bytes}
+
+
+def run_context_size(payload: Dict[str, Any], response_events: List[Dict[str, Any]]) -> Dict[str, int]:
+    """context_size de uma sessão nova depois de um /run: a mensagem enviada mais os eventos da resposta.
+
+    Dá o mesmo que context_size(get_session(...)) sem pedir ao servidor a sessão inteira
+    (que traz de volta o PDF em base64).
+    """
+    return context_size({"events": [{"content": payload["new_message"]}] + response_events})
+
+
+class SessionManager:
+    """Uma sessão ADK nova por extração, apagada no fim.
+
+    Assim o histórico (e o custo do contexto) não cresce com cada PDF processado e
+    utilizadores em simultâneo não partilham sessões. Sessões que não foram apagadas
+    (falha no DELETE, processo interrompido) são apagadas quando passam o ttl.
+    O tamanho do contexto de cada extração fica registado em recent_context_sizes
+    (calculado localmente a partir do pedido e da resposta, sem pedidos extra ao servidor).
+    """
+
+    def __init__(self, client: ADKClient, prefix: str = "extract", ttl: float = DEFAULT_SESSION_TTL,
+                 measure_context: bool = True, history: int = 100):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.measure_context = measure_context
+        self.created = 0
+        self.deleted = 0
+        self.expired = 0
+        self.recent_context_sizes = deque(maxlen=history)
+        self._active: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> str:
+        """Cria uma sessão com ID único e retorna o ID"""
+        self.expire_stale()
+        session_id = f"{self.prefix}-{uuid.uuid4().hex}"
+        self.client.create_session(session_id)
+        with self._lock:
+            self._active[session_id] = time.monotonic()
+            self.created += 1
+        return session_id
+
+    def release(self, session_id: str) -> None:
+        """Apaga a sessão; se falhar, fica ativa e será apagada por TTL"""
+        try:
+            self.client.delete_session(session_id)
+        except requests.exceptions.RequestException:
+            return
+        with self._lock:
+            if self._active.pop(session_id, None) is not None:
+                self.deleted += 1
+
+    def expire_stale(self) -> int:
+        """Apaga as sessões criadas há mais de ttl segundos; retorna quantas foram apagadas"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [session_id for session_id, created in self._active.items() if now - created > self.ttl]
+        expired = 0
+        for session_id in stale:
+            try:
+                self.client.delete_session(session_id)
+            except requests.exceptions.RequestException:
+                continue
+            with self._lock:
+                if self._active.pop(session_id, None) is not None:
+                    expired += 1
+        with self._lock:
+            self.expired += expired
+        return expired
+
+    @contextmanager
+    def session(self) -> Iterator[str]:
+        session_id = self.acquire()
+        try:
+            yield session_id
+        finally:
+            self.release(session_id)
+
+    def extract_invoice(self, pdf_bytes: bytes, stream: bool = False,
+                        on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        """Extrai uma fatura numa sessão própria, regista o tamanho do contexto e apaga a sessão"""
+        try:
+            with self.session() as session_id:
+                return self.client.extract_invoice(pdf_bytes, session_id, stream=stream, on_field=on_field,
+                                                   on_context=self._record_context if self.measure_context else None)
+        except requests.exceptions.RequestException as e:
+            raise ExtractionError(f"Erro ao tentar criar/verificar sessão: {e}")
+
+    def _record_context(self, size: Dict[str, int]) -> None:
+        with self._lock:
+            self.recent_context_sizes.append(size)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = list(self.recent_context_sizes)
+            active = len(self._active)
+        mean = lambda key: sum(size[key] for size in sizes) / len(sizes) if sizes else 0.0
+        return {
+            "active": active,
+            "created": self.created,
+            "deleted": self.deleted,
+            "expired": self.expired,
+            "mean_events": mean("events"),
+            "mean_text_chars": mean("text_chars"),
+            "mean_inline_bytes": mean("inline_bytes"),
+        }
+
+
+def _extract_batch_item(sessions: SessionManager, pdf_bytes: bytes) -> Dict[str, Any]:
+    """Executado numa thread do pool: extrai o PDF numa sessão ADK própria"""
+    start = time.perf_counter()
+    try:
+        data, error = sessions.extract_invoice(pdf_bytes), ""
+    except ExtractionError as e:
+        data, error = None, str(e)
+    return {"data": data, "error": error, "seconds": time.perf_counter() - start, "cached": False}
+
+
+def extract_batch(files: Iterable[Tuple[str, Optional[bytes]]], sessions: SessionManager,
+                  workers: int = DEFAULT_BATCH_WORKERS, cache: Optional[ExtractionCache] = None,
+                  window: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Extrai vários PDFs em paralelo; produz (índice, resultado) à medida que cada um termina.
+
+    files é lido à medida que há lugar (pode ser um gerador que lê os ficheiros): no máximo
+    `window` extrações submetidas de cada vez (por omissão 2 * workers), pelo que a memória não
+    depende do tamanho do lote e há sempre PDFs à espera quando um worker fica livre. Um PDF
+    sem conteúdo (None) produz logo um erro. Cada resultado tem "data" (ou None), "error",
+    "seconds" e "cached". PDFs repetidos enquanto o primeiro está a ser extraído são enviados
+    uma só vez. A cache só é usada nesta thread (consulta antes, escrita depois).
+    """
+    workers = max(1, workers)
+    window = max(workers, window or 2 * workers)
+    waiting: Dict[str, List[int]] = {}
+    in_flight: Dict[Future, str] = {}
+    remaining = enumerate(files)
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while not exhausted and len(in_flight) < window:
+                item = next(remaining, None)
+                if item is None:
+                    exhausted = True
+                    break
+                index, (name, pdf_bytes) = item
+                if pdf_bytes is None:
+                    yield index, {"data": None, "error": f"Não foi possível ler o ficheiro {name}", "seconds": 0.0,
+                                  "cached": False}
+                    continue
+                digest = pdf_digest(pdf_bytes)
+                cached = cache.get(digest) if cache is not None else None
+                if cached is not None:
+                    yield index, {"data": cached, "error": "", "seconds": 0.0, "cached": True}
+                    continue
+                if digest in waiting:
+                    waiting[digest].append(index)
+                    continue
+                waiting[digest] = [index]
+                in_flight[executor.submit(_extract_batch_item, sessions, pdf_bytes)] = digest
+            if not in_flight:
+                return
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                digest = in_flight.pop(future)
+                result = future.result()
+                if cache is not None and result["data"] is not None:
+                    cache.put(digest, result["data"])
+                for index in waiting.pop(digest):
+                    yield index, result
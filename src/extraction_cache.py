@@ -0,0 +1,164 @@
+"""Cache em disco dos dados extraídos pelo LLM.
+
+A chave é o SHA-256 do conteúdo do PDF, do prompt de extração e da definição
+do agente (que escolhe o modelo): o mesmo PDF (com outro nome ou não) nunca é
+enviado duas vezes ao LLM, e qualquer alteração ao prompt ou ao modelo invalida
+as entradas antigas.
+Cada entrada é um ficheiro JSON; quando o tamanho total passa do limite, as
+entradas usadas há mais tempo são removidas.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+# Incrementar se o formato das entradas mudar
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "invoice-processor", "extractions")
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Agents", "invoices")
+PROMPT_PATH = os.path.join(AGENT_DIR, "prompt.py")
+AGENT_PATH = os.path.join(AGENT_DIR, "agent.py")
+
+
+def _file_fingerprint(path: str) -> str:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+def prompt_fingerprint(path: str = PROMPT_PATH) -> str:
+    """SHA-256 do ficheiro do prompt (sem importar o agente); vazio se o ficheiro não existir"""
+    return _file_fingerprint(path)
+
+
+def agent_fingerprint(path: str = AGENT_PATH) -> str:
+    """SHA-256 da definição do agente, onde está o modelo (sem o importar); vazio se não existir"""
+    return _file_fingerprint(path)
+
+
+def pdf_digest(pdf_bytes: bytes) -> str:
+    """SHA-256 do conteúdo do PDF (identifica o ficheiro independentemente do nome)"""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class ExtractionCache:
+    """Cache persistente (um JSON por entrada) com limite de tamanho e remoção das menos usadas"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 prompt: str = "", model_version: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prompt = prompt
+        self.model_version = model_version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                self._sizes[entry.path] = entry.stat().st_size
+        self._total_bytes = sum(self._sizes.values())
+
+    def key(self, pdf_bytes_or_digest: Any) -> str:
+        """Chave da entrada: SHA-256 do PDF + prompt + versão do modelo"""
+        digest = pdf_bytes_or_digest if isinstance(pdf_bytes_or_digest, str) else pdf_digest(pdf_bytes_or_digest)
+        material = f"{CACHE_FORMAT_VERSION}\0{digest}\0{self.prompt}\0{self.model_version}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, pdf_bytes_or_digest: Any) -> Optional[Dict[str, Any]]:
+        """Dados extraídos em cache para este PDF, ou None"""
+        path = self._path(self.key(pdf_bytes_or_digest))
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Marca a entrada como usada agora (a remoção é pela data de modificação)
+        try:
+            os.utime(path)
+            if path not in self._sizes:
+                # Escrita por outro processo com a mesma pasta
+                self._sizes[path] = os.path.getsize(path)
+                self._total_bytes += self._sizes[path]
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, pdf_bytes_or_digest: Any, data: Dict[str, Any]) -> None:
+        """Guarda os dados extraídos (escrita atómica) e remove entradas antigas se necessário"""
+        path = self._path(self.key(pdf_bytes_or_digest))
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._total_bytes += len(payload) - self._sizes.get(path, 0)
+        self._sizes[path] = len(payload)
+        self._evict(keep=path)
+
+    def _evict(self, keep: str) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        by_age = []
+        for path in self._sizes:
+            try:
+                by_age.append((os.path.getmtime(path), path))
+            except OSError:
+                by_age.append((0.0, path))
+        for _, path in sorted(by_age):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._total_bytes -= self._sizes.pop(path)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        for path in list(self._sizes):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._sizes.clear()
+        self._total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
@@ -0,0 +1,173 @@
+"""Extrações em segundo plano, identificadas por um ID de job.
+
+A UI submete os PDFs e volta logo ao utilizador; as extrações correm num pool de
+threads deste processo e os resultados ficam num ExtractionJobStore partilhado
+(st.cache_resource), que sobrevive a reruns e a religações do browser. A UI vai
+consultando o estado dos jobs até estarem concluídos.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from extraction import DEFAULT_BATCH_WORKERS, DEFAULT_POOL_MAXSIZE, ExtractionError, SessionManager
+from extraction_cache import ExtractionCache, pdf_digest
+from scheduler import ConcurrencyLimiter
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = frozenset({JOB_DONE, JOB_FAILED})
+
+# Jobs terminados são esquecidos ao fim deste tempo (segundos)
+DEFAULT_JOB_RETENTION = 3600
+
+
+class ExtractionJob:
+    """Estado de uma extração; só o ExtractionJobStore altera os campos"""
+    __slots__ = ('id', 'filename', 'digest', 'pdf_bytes', 'stream', 'status', 'partial', 'data', 'error', 'cached',
+                 'submitted_at', 'started_at', 'finished_at')
+
+    def __init__(self, filename: str, pdf_bytes: bytes, stream: bool = False):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.digest = pdf_digest(pdf_bytes)
+        self.pdf_bytes = pdf_bytes
+        self.stream = stream
+        self.status = JOB_PENDING
+        # Em streaming, os campos já recebidos enquanto o job corre
+        self.partial = {}
+        self.data = None
+        self.error = ""
+        self.cached = False
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def seconds(self) -> float:
+        """Tempo de extração (desde o início do trabalho até ao fim, ou até agora)"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class ExtractionJobStore:
+    """Pool de threads de extração mais o registo dos jobs, seguro entre threads.
+
+    max_workers limita as extrações em simultâneo e pode ser alterado a qualquer momento
+    (o pool tem DEFAULT_POOL_MAXSIZE threads; as que passam do limite esperam a sua vez).
+    Um PDF igual a um job ainda pendente ou em curso reutiliza esse job. O conteúdo do PDF
+    (job.pdf_bytes) é largado quando o job termina, exceto com keep_pdf_bytes=True (a UI
+    precisa dele para repor o lote depois de recarregar a página).
+    """
+
+    def __init__(self, sessions: SessionManager, max_workers: int = DEFAULT_BATCH_WORKERS,
+                 cache: Optional[ExtractionCache] = None, retention: float = DEFAULT_JOB_RETENTION,
+                 keep_pdf_bytes: bool = False):
+        self.sessions = sessions
+        self.cache = cache
+        self.retention = retention
+        self.keep_pdf_bytes = keep_pdf_bytes
+        self._cancelled = threading.Event()
+        self._limiter = ConcurrencyLimiter(max_workers)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, ExtractionJob] = {}
+        self._executor = ThreadPoolExecutor(max_workers=DEFAULT_POOL_MAXSIZE, thread_name_prefix="extraction")
+
+    @property
+    def max_workers(self) -> int:
+        return self._limiter.limit
+
+    @max_workers.setter
+    def max_workers(self, value: int) -> None:
+        self._limiter.limit = value
+
+    def submit(self, filename: str, pdf_bytes: bytes, stream: bool = False) -> str:
+        """Cria um job de extração e retorna o seu ID (sem esperar pela extração).
+
+        Com stream=True a extração usa o endpoint SSE e job.partial vai recebendo os campos.
+        """
+        self.prune()
+        job = ExtractionJob(filename, pdf_bytes, stream)
+        with self._lock:
+            for other in self._jobs.values():
+                if other.digest == job.digest and not other.finished:
+                    return other.id
+
+            cached = self.cache.get(job.digest) if self.cache is not None else None
+            if cached is not None:
+                job.status, job.data, job.cached = JOB_DONE, cached, True
+                job.started_at = job.finished_at = time.time()
+                if not self.keep_pdf_bytes:
+                    job.pdf_bytes = None
+            self._jobs[job.id] = job
+        if cached is None:
+            self._executor.submit(self._run, job)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[ExtractionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_many(self, job_ids: Iterable[str]) -> List[Optional[ExtractionJob]]:
+        with self._lock:
+            return [self._jobs.get(job_id) for job_id in job_ids]
+
+    def prune(self) -> int:
+        """Esquece os jobs terminados há mais de `retention` segundos"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def status_counts(self) -> Dict[str, int]:
+        counts = {JOB_PENDING: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def _run(self, job: ExtractionJob) -> None:
+        with self._limiter.slot():
+            if self._cancelled.is_set():
+                # shutdown(cancel_futures=True) antes de o job começar: fica pendente
+                return
+            job.started_at = time.time()
+            job.status = JOB_RUNNING
+            data, error = None, ""
+            try:
+                data = self.sessions.extract_invoice(job.pdf_bytes, stream=job.stream,
+                                                     on_field=job.partial.__setitem__)
+            except ExtractionError as e:
+                error = str(e)
+            except Exception as e:
+                error = f"Erro inesperado ao processar a fatura: {e}"
+            if data is not None and self.cache is not None:
+                with self._lock:
+                    self.cache.put(job.digest, data)
+            # O estado muda por último: quem o lê como terminado já vê os dados e o erro
+            job.data, job.error, job.finished_at = data, error, time.time()
+            if not self.keep_pdf_bytes:
+                job.pdf_bytes = None
+            job.status = JOB_DONE if data is not None else JOB_FAILED
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        """Termina o pool; com cancel_futures=True só acabam os jobs já em curso.
+
+        Os jobs cancelados ficam pendentes (job.finished é False), pelo que quem os submeteu
+        sabe que não correram.
+        """
+        if cancel_futures:
+            # Também os que já têm thread mas ainda esperam por lugar no limite de max_workers
+            self._cancelled.set()
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
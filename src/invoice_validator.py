@@ -1,231 +1,942 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, field_validator
+from typing import Optional, Dict, Any, Iterable, List, Set, Callable, Pattern, Tuple, Union, Literal, get_args
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal
+from itertools import cycle, islice
+import os
 import re
+import time
 from enum import Enum
 
+from amount_parser import parse_amount
+from date_parser import parse_document_date
+
 class ValidationStatus(Enum):
     GOOD = "good"      # Verde
     WARNING = "warning" # Amarelo
     BAD = "bad"        # Vermelho
 
+# Incrementar sempre que as regras mudarem, para invalidar resultados em cache
+RULESET_VERSION = 5
+# Faturas validadas de cada vez por validate_many(compact=True)
+COMPACT_CHUNK_SIZE = 2000
+
 class ValidationResult:
+    """Resultado imutável de uma validação; os resultados mais comuns são instâncias partilhadas"""
+    __slots__ = ('status', 'message')
+    _interned: Dict[Tuple[ValidationStatus, str], "ValidationResult"] = {}
+
     def __init__(self, status: ValidationStatus, message: str = ""):
-        self.status = status
-        self.message = message
+        object.__setattr__(self, 'status', status)
+        object.__setattr__(self, 'message', message)
+
+    @classmethod
+    def intern(cls, status: ValidationStatus, message: str = "") -> "ValidationResult":
+        """Retorna a instância partilhada para (status, mensagem); usar só com mensagens fixas"""
+        key = (status, message)
+        result = cls._interned.get(key)
+        if result is None:
+            result = cls._interned[key] = cls(status, message)
+        return result
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ValidationResult é imutável")
+
+    def __delattr__(self, name):
+        raise AttributeError("ValidationResult é imutável")
+
+    def __eq__(self, other):
+        if not isinstance(other, ValidationResult):
+            return NotImplemented
+        return self.status is other.status and self.message == other.message
+
+    def __hash__(self):
+        return hash((self.status, self.message))
+
+    def __repr__(self):
+        return f"ValidationResult({self.status}, {self.message!r})"
+
+    @classmethod
+    def _unpickle(cls, status: ValidationStatus, message: str) -> "ValidationResult":
+        # Só reaproveita instâncias já partilhadas: mensagens dinâmicas não entram em _interned
+        result = cls._interned.get((status, message))
+        return cls(status, message) if result is None else result
+
+    def __reduce__(self):
+        # Ao deserializar (p.ex. entre processos) as mensagens fixas voltam a ser partilhadas
+        return (ValidationResult._unpickle, (self.status, self.message))
+
+# Resultados partilhados para os casos mais comuns
+_VALID = ValidationResult.intern(ValidationStatus.GOOD, "Válido")
+_REQUIRED_EMPTY = ValidationResult.intern(ValidationStatus.BAD, "Campo obrigatório vazio")
+_EMPTY = ValidationResult.intern(ValidationStatus.WARNING, "Campo vazio ")
+_FUTURE_DATE = ValidationResult.intern(ValidationStatus.WARNING, "Data no futuro")
+_OLD_DATE = ValidationResult.intern(ValidationStatus.WARNING, "Data muito antiga")
+_INVALID_AMOUNT = ValidationResult.intern(ValidationStatus.BAD, "Formato de valor inválido")
+_NEGATIVE_AMOUNT = ValidationResult.intern(ValidationStatus.BAD, "Valor não pode ser negativo")
+_ZERO_AMOUNT = ValidationResult.intern(ValidationStatus.WARNING, "Valor zero")
+
+# Tipos de documento: códigos pedidos ao LLM em prompt.py e nomes usados anteriormente
+DocumentTypeCode = Literal['INVO', 'CRME', 'PRFM', 'RCP', 'ORCF', 'DLVN', 'NA',
+                           'Invoice', 'Factura', 'Receipt', 'Recibo', 'Credit Note', 'Nota de Crédito']
+Currency = Literal['EUR', 'USD', 'GBP', 'BRL', 'JPY', 'CHF', 'CAD', 'AUD']  # ISO 4217
+
+# Regras compiladas uma única vez, na importação do módulo
+VALID_DOCUMENT_TYPES = frozenset(get_args(DocumentTypeCode))
+VALID_CURRENCIES = frozenset(get_args(Currency))
+REQUIRED_FIELDS = frozenset({'DocumentID', 'DocumentDate', 'VendorName', 'CustomerName'})
+AMOUNT_FIELDS = frozenset({'TotalDocumentAmount', 'NetDocumentAmount', 'VATAmount'})
+# Campos com validador no modelo Pydantic; nos restantes (str livre) o modelo nunca falha
+_MODEL_CHECKED_FIELDS = frozenset({'DocumentDate', 'CurrencyCode', 'VendorTaxID', 'CustomerTaxID'}) | AMOUNT_FIELDS
+
+_NON_DIGITS_RE = re.compile(r'[^\d]')
+_TAX_ID_SEPARATORS_RE = re.compile(r'[\s.\-/]')
+# Forma genérica de um NIF/VAT (com ou sem prefixo de país); a validação por país é feita nas regras
+_TAX_ID_SHAPE_RE = re.compile(r'[A-Z]{0,2}(?=[A-Z0-9]*\d)[A-Z0-9]{8,13}')
+_NIF_WEIGHTS = (9, 8, 7, 6, 5, 4, 3, 2)
+
+def _is_blank(v: Any) -> bool:
+    return v is None or (isinstance(v, str) and v.strip() == "")
 
 class InvoiceData(BaseModel):
-    DocumentType: Optional[str] = Field(default="", description="Tipo do documento")
+    DocumentType: Optional[DocumentTypeCode] = Field(default=None, description="Tipo do documento")
     DocumentID: Optional[str] = Field(default="", description="ID do documento")
-    DocumentDate: Optional[str] = Field(default="", description="Data do documento")
+    DocumentDate: Optional[date] = Field(default=None, description="Data do documento")
     Language: Optional[str] = Field(default="", description="Idioma do documento")
     
-    CurrencyCode: Optional[str] = Field(default="", description="Código da moeda")
-    TotalDocumentAmount: Optional[str] = Field(default="", description="Valor total")
-    NetDocumentAmount: Optional[str] = Field(default="", description="Valor líquido")
-    VATAmount: Optional[str] = Field(default="", description="Valor do IVA")
+    CurrencyCode: Optional[Currency] = Field(default=None, description="Código da moeda")
+    TotalDocumentAmount: Optional[Decimal] = Field(default=None, description="Valor total")
+    NetDocumentAmount: Optional[Decimal] = Field(default=None, description="Valor líquido")
+    VATAmount: Optional[Decimal] = Field(default=None, description="Valor do IVA")
     
     VendorName: Optional[str] = Field(default="", description="Nome do fornecedor")
-    VendorTaxID: Optional[str] = Field(default="", description="NIF do fornecedor")
+    VendorTaxID: Optional[str] = Field(default=None, description="NIF do fornecedor")
     VendorCountryCode: Optional[str] = Field(default="", description="País do fornecedor")
     
     CustomerName: Optional[str] = Field(default="", description="Nome do cliente")
-    CustomerTaxID: Optional[str] = Field(default="", description="NIF do cliente")
+    CustomerTaxID: Optional[str] = Field(default=None, description="NIF do cliente")
     CustomerCountryCode: Optional[str] = Field(default="", description="País do cliente")
 
-    @validator('DocumentDate')
+    @field_validator('DocumentType', mode='before')
+    @classmethod
+    def validate_document_type(cls, v):
+        # Tipos desconhecidos falham no Literal; no InvoiceValidator são apenas um aviso
+        return None if _is_blank(v) else v
+
+    @field_validator('DocumentDate', mode='before')
+    @classmethod
     def validate_date(cls, v):
-        if not v or v.strip() == "":
+        if _is_blank(v):
+            return None
+        if not isinstance(v, str):
             return v
         
-        # Tentar diferentes formatos de data
-        date_formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']
-        for fmt in date_formats:
-            try:
-                datetime.strptime(v.strip(), fmt)
-                return v
-            except ValueError:
-                continue
-        
-        # Se chegou aqui, a data não está em formato válido
-        raise ValueError(f"Data inválida: {v}")
+        # O resultado fica em cache e é reaproveitado pela regra do campo
+        parsed = parse_document_date(v)
+        if parsed is None:
+            raise ValueError(f"Data inválida: {v}")
+        return parsed
 
-    @validator('CurrencyCode')
+    @field_validator('CurrencyCode', mode='before')
+    @classmethod
     def validate_currency(cls, v):
-        if not v or v.strip() == "":
-            return v
+        if _is_blank(v):
+            return None
         
-        # Lista de códigos de moeda válidos (ISO 4217)
-        valid_currencies = ['EUR', 'USD', 'GBP', 'BRL', 'JPY', 'CHF', 'CAD', 'AUD']
-        if v.upper() not in valid_currencies:
+        if v.upper() not in VALID_CURRENCIES:
             raise ValueError(f"Código de moeda inválido: {v}")
         
         return v.upper()
 
-    @validator('TotalDocumentAmount', 'NetDocumentAmount', 'VATAmount')
+    @field_validator('TotalDocumentAmount', 'NetDocumentAmount', 'VATAmount', mode='before')
+    @classmethod
     def validate_amounts(cls, v):
-        if not v or v.strip() == "":
-            return v
-        
-        # Remover símbolos de moeda e espaços
-        cleaned = re.sub(r'[€$£¥\s]', '', v.strip())
+        if _is_blank(v):
+            return None
+        if isinstance(v, (int, float)):
+            # Números vindos diretamente do JSON do LLM
+            return Decimal(str(v))
         
-        # Aceitar tanto vírgula quanto ponto como separador decimal
-        cleaned = cleaned.replace(',', '.')
-        
-        try:
-            float(cleaned)
-            return cleaned
-        except ValueError:
+        # Aceita separadores de milhares/decimais europeus e anglo-saxónicos e símbolos de moeda
+        amount = parse_amount(v)
+        if amount is None:
             raise ValueError(f"Valor monetário inválido: {v}")
+        return amount
 
-    @validator('VendorTaxID', 'CustomerTaxID')
+    @field_validator('VendorTaxID', 'CustomerTaxID', mode='before')
+    @classmethod
     def validate_tax_id(cls, v):
-        if not v or v.strip() == "":
-            return v
+        if _is_blank(v):
+            return None
         
-        # Validação básica para NIF português (9 dígitos)
-        cleaned = re.sub(r'[^\d]', '', v)
-        if len(cleaned) != 9:
-            raise ValueError(f"NIF deve ter 9 dígitos: {v}")
+        # Só a forma geral; o formato e o dígito de controlo dependem do país (ver TAX_ID_VALIDATORS)
+        cleaned = _TAX_ID_SEPARATORS_RE.sub('', v).upper()
+        if not _TAX_ID_SHAPE_RE.fullmatch(cleaned):
+            raise ValueError(f"NIF com formato inválido: {v}")
         
         return cleaned
 
+# Validação de listas inteiras de faturas dentro do pydantic-core, numa única chamada
+INVOICE_LIST_ADAPTER = TypeAdapter(List[InvoiceData])
+
+# Validador do modelo de cada campo verificado: para texto, o tipo do campo nunca falha depois dele,
+# por isso um campo isolado dispensa construir um InvoiceData inteiro
+_MODEL_FIELD_VALIDATORS = {
+    'DocumentDate': InvoiceData.validate_date,
+    'CurrencyCode': InvoiceData.validate_currency,
+    'TotalDocumentAmount': InvoiceData.validate_amounts,
+    'NetDocumentAmount': InvoiceData.validate_amounts,
+    'VATAmount': InvoiceData.validate_amounts,
+    'VendorTaxID': InvoiceData.validate_tax_id,
+    'CustomerTaxID': InvoiceData.validate_tax_id,
+}
+
+def _model_error_message(field_name: str, value: Any, error: ValueError) -> str:
+    """Mensagem igual à do ValidationError que o InvoiceData daria para este campo"""
+    details = [{'type': 'value_error', 'loc': (field_name,), 'input': value, 'ctx': {'error': error}}]
+    return str(ValidationError.from_exception_data(InvoiceData.__name__, details))
+
+# Mapear as chaves do formulário para as chaves do modelo Pydantic
+FORM_TO_MODEL = {
+    "doc_type": "DocumentType",
+    "doc_id": "DocumentID",
+    "doc_date": "DocumentDate",
+    "language": "Language",
+    "currency": "CurrencyCode",
+    "total_amount": "TotalDocumentAmount",
+    "net_amount": "NetDocumentAmount",
+    "vat_amount": "VATAmount",
+    "vendor_name": "VendorName",
+    "vendor_tax_id": "VendorTaxID",
+    "vendor_country": "VendorCountryCode",
+    "customer_name": "CustomerName",
+    "customer_tax_id": "CustomerTaxID",
+    "customer_country": "CustomerCountryCode"
+}
+MODEL_TO_FORM = {model_key: form_key for form_key, model_key in FORM_TO_MODEL.items()}
+
+def normalize_extracted_data(extracted_data: Dict[str, Any]) -> Dict[str, str]:
+    """Valores dos campos do modelo como texto, como o InvoiceValidator os espera (em falta -> "")"""
+    invoice_data = {}
+    for model_key in FORM_TO_MODEL.values():
+        value = extracted_data.get(model_key)
+        invoice_data[model_key] = "" if value is None else str(value)
+    return invoice_data
+
+# Grafo de dependências: campo -> campos que a sua validação também lê
+FIELD_DEPENDENCIES = {
+    'TotalDocumentAmount': ('NetDocumentAmount', 'VATAmount'),
+    'VendorTaxID': ('VendorCountryCode',),
+    'CustomerTaxID': ('CustomerCountryCode',),
+}
+
+# Grafo invertido: campo -> campos que têm de ser revalidados quando ele muda
+_FIELD_DEPENDENTS: Dict[str, Set[str]] = {}
+for _field, _dependencies in FIELD_DEPENDENCIES.items():
+    for _dependency in _dependencies:
+        _FIELD_DEPENDENTS.setdefault(_dependency, set()).add(_field)
+
+# --- Validação de NIF/VAT por país ---
+# Cada função recebe o número já normalizado (sem prefixo) e que passou o formato do país
+
+def _checksum_pt(number: str) -> bool:
+    check_digit = int(number[8])
+    remainder = sum(int(digit) * weight for digit, weight in zip(number, _NIF_WEIGHTS)) % 11
+    return check_digit == (0 if remainder < 2 else 11 - remainder)
+
+_ES_DNI_LETTERS = "TRWAGMYFPDXBNJZSQVHLCKE"
+_ES_NIE_PREFIXES = {"X": "0", "Y": "1", "Z": "2"}
+_ES_CIF_LETTERS = "JABCDEFGHI"
+_FR_LA_POSTE_SIREN = "356000000"  # exceção histórica ao algoritmo de Luhn
+_IT_SPECIAL_OFFICES = frozenset({120, 121, 888, 999})
+
+def _checksum_es(number: str) -> bool:
+    first = number[0]
+    if first.isdigit() or first in _ES_NIE_PREFIXES:
+        # DNI (8 dígitos + letra) ou NIE (X/Y/Z + 7 dígitos + letra)
+        digits = _ES_NIE_PREFIXES.get(first, first) + number[1:8]
+        return number[8] == _ES_DNI_LETTERS[int(digits) % 23]
+    
+    # CIF (letra + 7 dígitos + controlo)
+    total = 0
+    for position, digit in enumerate(number[1:8]):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            value = value // 10 + value % 10
+        total += value
+    control = (10 - total % 10) % 10
+    # Na prática aparecem as duas formas de controlo (dígito ou letra) em todos os tipos de entidade
+    return number[8] in (str(control), _ES_CIF_LETTERS[control])
+
+def _luhn(number: str) -> bool:
+    total = 0
+    for position, digit in enumerate(reversed(number)):
+        value = int(digit)
+        if position % 2:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
+
+def _checksum_fr(number: str) -> bool:
+    if len(number) == 9:
+        # SIREN sem chave de IVA
+        return _luhn(number)
+    key, siren = number[:2], number[2:]
+    if siren != _FR_LA_POSTE_SIREN and not _luhn(siren):
+        return False
+    # Chaves alfanuméricas (formato novo) não têm algoritmo público: só o SIREN é verificado
+    return not key.isdigit() or int(key) == (12 + 3 * (int(siren) % 97)) % 97
+
+def _checksum_nl(number: str) -> bool:
+    digits = number[:9]
+    if number[10:] == "00":
+        return False
+    # Algoritmo "elfproef" (mod 11) ou, para empresários em nome individual, mod 97 sobre "NL" + número
+    if (sum(int(digit) * weight for digit, weight in zip(digits, _NIF_WEIGHTS)) - int(digits[8])) % 11 == 0:
+        return True
+    return int("2321" + digits + "11" + number[10:]) % 97 == 1
+
+def _checksum_de(number: str) -> bool:
+    # ISO 7064, MOD 11,10
+    product = 10
+    for digit in number[:8]:
+        total = (int(digit) + product) % 10 or 10
+        product = (2 * total) % 11
+    check_digit = 11 - product
+    return (0 if check_digit == 10 else check_digit) == int(number[8])
+
+def _checksum_it(number: str) -> bool:
+    # Os dígitos 8-10 identificam o serviço de finanças (001-100, 120, 121, 888, 999)
+    office = int(number[7:10])
+    if number[:7] == "0000000" or not (1 <= office <= 100 or office in _IT_SPECIAL_OFFICES):
+        return False
+    return _luhn(number)
+
+# Registo país -> (formato pré-compilado, dígito de controlo); a procura é um único acesso ao dict
+TAX_ID_VALIDATORS: Dict[str, Tuple[Pattern, Callable[[str], bool]]] = {
+    'PT': (re.compile(r'\d{9}'), _checksum_pt),
+    'ES': (re.compile(r'\d{8}[A-Z]|[XYZ]\d{7}[A-Z]|[ABCDEFGHJNPQRSUVW]\d{7}[0-9A-J]'), _checksum_es),
+    'FR': (re.compile(r'[0-9A-HJ-NP-Z]{2}\d{9}|\d{9}'), _checksum_fr),
+    'NL': (re.compile(r'\d{9}B\d{2}'), _checksum_nl),
+    'DE': (re.compile(r'[1-9]\d{8}'), _checksum_de),
+    'IT': (re.compile(r'\d{11}'), _checksum_it),
+}
+# Sem país nem prefixo assume-se um NIF português (comportamento original)
+DEFAULT_TAX_ID_COUNTRY = 'PT'
+
+_TAX_ID_BAD_CHECKSUM = ValidationResult.intern(ValidationStatus.BAD, "NIF inválido (dígito de controle)")
+_TAX_ID_BAD_PT_LENGTH = ValidationResult.intern(ValidationStatus.BAD, "NIF deve ter 9 dígitos")
+_TAX_ID_BAD_FORMAT = {country: ValidationResult.intern(ValidationStatus.BAD, f"NIF com formato inválido para {country}")
+                      for country in TAX_ID_VALIDATORS}
+
+def _resolve_tax_id(value: str, country_code: Optional[str]) -> Tuple[str, str]:
+    """Retorna (país, número sem prefixo); o prefixo de IVA da UE tem prioridade sobre o país indicado"""
+    cleaned = _TAX_ID_SEPARATORS_RE.sub('', value).upper()
+    prefix = cleaned[:2]
+    if prefix in TAX_ID_VALIDATORS and TAX_ID_VALIDATORS[prefix][0].fullmatch(cleaned[2:]):
+        return prefix, cleaned[2:]
+    
+    country = country_code.strip().upper() if isinstance(country_code, str) else ""
+    if len(country) != 2 or not country.isalpha():
+        country = DEFAULT_TAX_ID_COUNTRY
+    if country == 'PT':
+        # Como antes, para NIF portugueses só os dígitos contam
+        cleaned = _NON_DIGITS_RE.sub('', cleaned)
+    return country, cleaned
+
+def _rule_document_type(value: str, invoice_data: Dict[str, Any]) -> Optional[ValidationResult]:
+    if value not in VALID_DOCUMENT_TYPES:
+        return ValidationResult(ValidationStatus.WARNING, f"Tipo não reconhecido: {value}")
+    return None
+
+def _rule_document_date(value: str, invoice_data: Dict[str, Any]) -> Optional[ValidationResult]:
+    # Verificar se a data não é muito antiga ou futura
+    parsed_date = parse_document_date(value)
+    
+    if parsed_date:
+        today = date.today()
+        if parsed_date > today:
+            return _FUTURE_DATE
+        elif (today - parsed_date).days > 365 * 5:  # Mais de 5 anos
+            return _OLD_DATE
+    return None
+
+def _rule_amount(value: str, invoice_data: Dict[str, Any]) -> Optional[ValidationResult]:
+    amount = parse_amount(value)
+    if amount is None:
+        return _INVALID_AMOUNT
+    
+    if amount < 0:
+        return _NEGATIVE_AMOUNT
+    elif amount == 0:
+        return _ZERO_AMOUNT
+    return None
+
+def _rule_total_amount(value: str, invoice_data: Dict[str, Any]) -> Optional[ValidationResult]:
+    result = _rule_amount(value, invoice_data)
+    if result is not None:
+        return result
+    
+    # Verificar consistência entre valores (aritmética decimal exata, sem tolerância)
+    net = invoice_data.get('NetDocumentAmount')
+    vat = invoice_data.get('VATAmount')
+    if isinstance(net, str) and isinstance(vat, str):
+        net, vat = parse_amount(net), parse_amount(vat)
+        if net is None or vat is None:
+            return None
+        expected_total = net + vat
+        if parse_amount(value) != expected_total:
+            return ValidationResult(ValidationStatus.WARNING, f"Total não confere (esperado: {expected_total:.2f})")
+    return None
+
+def _make_tax_id_rule(country_field: str) -> Callable[[str, Dict[str, Any]], Optional[ValidationResult]]:
+    """Cria a regra de um campo de NIF, que depende do país da respetiva entidade"""
+    def _rule_tax_id(value: str, invoice_data: Dict[str, Any]) -> Optional[ValidationResult]:
+        result = InvoiceValidator.validate_tax_id(value, invoice_data.get(country_field))
+        return None if result is _VALID else result
+    return _rule_tax_id
+
+def _rule_currency(value: str, invoice_data: Dict[str, Any]) -> Optional[ValidationResult]:
+    if value.upper() not in VALID_CURRENCIES:
+        return ValidationResult(ValidationStatus.WARNING, f"Moeda não reconhecida: {value}")
+    return None
+
+# Tabela campo -> regra; campos sem entrada só passam pela validação do modelo
+_FIELD_RULES = {
+    'DocumentType': _rule_document_type,
+    'DocumentDate': _rule_document_date,
+    'TotalDocumentAmount': _rule_total_amount,
+    'NetDocumentAmount': _rule_amount,
+    'VATAmount': _rule_amount,
+    'VendorTaxID': _make_tax_id_rule('VendorCountryCode'),
+    'CustomerTaxID': _make_tax_id_rule('CustomerCountryCode'),
+    'CurrencyCode': _rule_currency,
+}
+# Nome de cada regra nas métricas de profiling (ex.: "total_amount", "tax_id")
+_FIELD_RULE_NAMES = {field_name: rule.__name__.removeprefix('_rule_') for field_name, rule in _FIELD_RULES.items()}
+
+# Campos com trabalho real de validação (regra ou verificação do modelo) cujo resultado não depende
+# da data atual (DocumentDate já tem a cache do date_parser) nem de outros valores (TotalDocumentAmount);
+# os NIF dependem do país, que entra na chave da cache (ver _cache_context)
+CACHEABLE_FIELDS = (frozenset(_FIELD_RULES) | _MODEL_CHECKED_FIELDS) - {'DocumentDate', 'TotalDocumentAmount'}
+_TAX_ID_COUNTRY_FIELDS = {'VendorTaxID': 'VendorCountryCode', 'CustomerTaxID': 'CustomerCountryCode'}
+
+def _cache_context(field_name: str, value: str, invoice_data: Dict[str, Any]) -> Optional[str]:
+    """Parte da chave da cache que vem do resto da fatura: o país efetivo de um NIF"""
+    country_field = _TAX_ID_COUNTRY_FIELDS.get(field_name)
+    if country_field is None:
+        return None
+    return _resolve_tax_id(value, invoice_data.get(country_field))[0]
+
+class ValidationCache:
+    """Cache LRU opcional de resultados, chaveada por (campo, valor, contexto, versão das regras)"""
+
+    def __init__(self, maxsize: int = 65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[tuple, ValidationResult]" = OrderedDict()
+
+    def get(self, field_name: str, value: str, context: Optional[str] = None) -> Optional[ValidationResult]:
+        # O valor entra na chave tal como está: as mensagens repetem o valor original
+        key = (field_name, value, context, RULESET_VERSION)
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, field_name: str, value: str, result: ValidationResult, context: Optional[str] = None) -> None:
+        key = (field_name, value, context, RULESET_VERSION)
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas de utilização da cache"""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+# Limites superiores (segundos) dos buckets dos histogramas de latência
+PROFILE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2, 0.1)
+
+class LatencyHistogram:
+    """Histograma de latências com buckets fixos (contagens não cumulativas; +Inf no fim)"""
+    __slots__ = ('counts', 'total')
+
+    def __init__(self, bucket_count: int):
+        self.counts = [0] * (bucket_count + 1)
+        self.total = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+class ValidationProfiler:
+    """Contagens e histogramas de latência por campo e por etapa da validação.
+
+    Etapas: "model" (construção do InvoiceData), o nome da regra do campo (ex.: "document_date",
+    "tax_id", "total_amount") e "total" (a validação completa do campo). Em validate_many, a
+    validação do lote inteiro pelo TypeAdapter fica no campo "*", etapa "model_batch".
+    Cada processo tem o seu próprio profiler: validate_parallel não junta os dos workers.
+
+    Com sample_every=N só uma em cada N validações de campo é medida, e as contagens exportadas
+    são multiplicadas por N (estimativas); em produção isto torna o custo do profiling residual.
+    """
+
+    def __init__(self, buckets: Iterable[float] = PROFILE_BUCKETS, sample_every: int = 1):
+        if sample_every < 1:
+            raise ValueError("sample_every deve ser >= 1")
+        self.buckets = tuple(sorted(buckets))
+        self.sample_every = sample_every
+        # next(sampler) indica se a próxima validação de campo deve ser medida
+        self.sampler = cycle([True] + [False] * (sample_every - 1))
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def observe(self, field_name: str, stage: str, seconds: float) -> None:
+        try:
+            histogram = self._histograms[field_name, stage]
+        except KeyError:
+            histogram = self._histograms[field_name, stage] = LatencyHistogram(len(self.buckets))
+        histogram.counts[bisect_left(self.buckets, seconds)] += 1
+        histogram.total += seconds
+
+    def call(self, field_name: str, stage: str, function: Callable, *args, **kwargs):
+        """Chama a função e regista o tempo gasto, mesmo que ela lance uma exceção"""
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.observe(field_name, stage, time.perf_counter() - start)
+
+    def reset(self) -> None:
+        self._histograms.clear()
+
+    def _cumulative(self, histogram: LatencyHistogram) -> List[Tuple[str, int]]:
+        bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+        cumulative, running = [], 0
+        for bound, count in zip(bounds, histogram.counts):
+            running += count * self.sample_every
+            cumulative.append((bound, running))
+        return cumulative
+
+    def to_dict(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Métricas por campo e etapa: count, sum e mean (segundos) e buckets cumulativos"""
+        metrics: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (field_name, stage), histogram in sorted(self._histograms.items()):
+            count = histogram.count
+            metrics.setdefault(field_name, {})[stage] = {
+                "count": count * self.sample_every,
+                "sum": histogram.total * self.sample_every,
+                "mean": histogram.total / count if count else 0.0,
+                "buckets": dict(self._cumulative(histogram)),
+            }
+        return metrics
+
+    def to_prometheus(self, metric_name: str = "invoice_validation_seconds") -> str:
+        """Exporta os histogramas no formato de texto do Prometheus"""
+        lines = [
+            f"# HELP {metric_name} Tempo de validação por campo e etapa",
+            f"# TYPE {metric_name} histogram",
+        ]
+        for (field_name, stage), histogram in sorted(self._histograms.items()):
+            labels = f'field="{field_name}",stage="{stage}"'
+            for bound, count in self._cumulative(histogram):
+                lines.append(f'{metric_name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{metric_name}_sum{{{labels}}} {histogram.total * self.sample_every!r}")
+            lines.append(f"{metric_name}_count{{{labels}}} {histogram.count * self.sample_every}")
+        return "\n".join(lines) + "\n"
+
+# Profiler ativo; com None (por omissão) a validação só paga uma verificação desta variável
+_profiler: Optional[ValidationProfiler] = None
+
+def enable_profiling(buckets: Iterable[float] = PROFILE_BUCKETS, sample_every: int = 1) -> ValidationProfiler:
+    """Ativa o profiling das regras (substitui o profiler anterior, se existir)"""
+    global _profiler
+    _profiler = ValidationProfiler(buckets, sample_every)
+    return _profiler
+
+def disable_profiling() -> Optional[ValidationProfiler]:
+    """Desativa o profiling e retorna o profiler que estava ativo, com as métricas recolhidas"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+def get_profiler() -> Optional[ValidationProfiler]:
+    return _profiler
+
+# INVOICE_VALIDATOR_PROFILE=N ativa o profiling logo na importação, medindo uma em cada N validações
+if os.environ.get("INVOICE_VALIDATOR_PROFILE", "").isdigit() and int(os.environ["INVOICE_VALIDATOR_PROFILE"]) > 0:
+    enable_profiling(sample_every=int(os.environ["INVOICE_VALIDATOR_PROFILE"]))
+
+# Códigos de estado usados na forma compacta (um byte por campo)
+_STATUS_CODES = {ValidationStatus.GOOD: 0, ValidationStatus.WARNING: 1, ValidationStatus.BAD: 2}
+_STATUSES = (ValidationStatus.GOOD, ValidationStatus.WARNING, ValidationStatus.BAD)
+
+class CompactResults:
+    """Resultados de um lote em forma compacta: um byte de estado por campo e uma tabela de mensagens.
+
+    Cada fatura ocupa len(field_keys) posições em `statuses` (bytearray) e em `message_ids`
+    (índices para `messages`); os ValidationResult só são criados ao aceder a uma fatura.
+    """
+    __slots__ = ('field_keys', 'statuses', 'message_ids', 'messages', '_message_index', '_results')
+
+    def __init__(self, field_keys: Iterable[str] = tuple(FORM_TO_MODEL)):
+        self.field_keys = tuple(field_keys)
+        self.statuses = bytearray()
+        self.message_ids = array('I')
+        self.messages: List[str] = []
+        self._message_index: Dict[str, int] = {}
+        # Resultados já materializados, partilhados entre faturas: (estado, mensagem) -> resultado
+        self._results: Dict[Tuple[int, int], ValidationResult] = {}
+
+    def append(self, results: Dict[str, ValidationResult]) -> None:
+        for key in self.field_keys:
+            result = results[key]
+            message_id = self._message_index.get(result.message)
+            if message_id is None:
+                message_id = self._message_index[result.message] = len(self.messages)
+                self.messages.append(result.message)
+            self.statuses.append(_STATUS_CODES[result.status])
+            self.message_ids.append(message_id)
+
+    def extend(self, other: "CompactResults") -> None:
+        """Junta os resultados de outro lote (com os mesmos campos) no fim deste"""
+        remap = []
+        for message in other.messages:
+            message_id = self._message_index.get(message)
+            if message_id is None:
+                message_id = self._message_index[message] = len(self.messages)
+                self.messages.append(message)
+            remap.append(message_id)
+        self.statuses.extend(other.statuses)
+        self.message_ids.extend(remap[message_id] for message_id in other.message_ids)
+
+    def __len__(self) -> int:
+        return len(self.statuses) // len(self.field_keys)
+
+    def __getitem__(self, index: int) -> Dict[str, ValidationResult]:
+        """Materializa os resultados de uma fatura (chaves do formulário)"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start = index * len(self.field_keys)
+        record = {}
+        for offset, key in enumerate(self.field_keys):
+            code = (self.statuses[start + offset], self.message_ids[start + offset])
+            result = self._results.get(code)
+            if result is None:
+                result = self._results[code] = ValidationResult(_STATUSES[code[0]], self.messages[code[1]])
+            record[key] = result
+        return record
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def status_counts(self) -> Dict[ValidationStatus, int]:
+        """Contagem de estados em todo o lote, sem materializar resultados"""
+        return {status: self.statuses.count(code) for status, code in _STATUS_CODES.items()}
+
+    def __getstate__(self):
+        # A cache de resultados materializados não é enviada entre processos
+        return (self.field_keys, self.statuses, self.message_ids, self.messages)
+
+    def __setstate__(self, state):
+        self.field_keys, self.statuses, self.message_ids, self.messages = state
+        self._message_index = {message: index for index, message in enumerate(self.messages)}
+        self._results = {}
+
 class InvoiceValidator:
     @staticmethod
-    def validate_field(field_name: str, value: str, invoice_data: Dict[str, Any]) -> ValidationResult:
+    def validate_field(field_name: str, value: str, invoice_data: Dict[str, Any],
+                       cache: Optional[ValidationCache] = None) -> ValidationResult:
         """Valida um campo específico e retorna o status de validação"""
+        if cache is None or field_name not in CACHEABLE_FIELDS or not isinstance(value, str):
+            return InvoiceValidator._validate_field(field_name, value, invoice_data, check_model=True)
         
-        if not value or value.strip() == "":
-            if field_name in ['DocumentID', 'DocumentDate', 'VendorName', 'CustomerName']:
-                return ValidationResult(ValidationStatus.BAD, "Campo obrigatório vazio")
+        context = _cache_context(field_name, value, invoice_data)
+        result = cache.get(field_name, value, context)
+        if result is None:
+            result = InvoiceValidator._validate_field(field_name, value, invoice_data, check_model=True)
+            cache.put(field_name, value, result, context)
+        return result
+
+    @staticmethod
+    def _validate_field(field_name: str, value: str, invoice_data: Dict[str, Any], check_model: bool) -> ValidationResult:
+        """Valida um campo; com check_model=False assume que o modelo Pydantic já foi validado"""
+        profiler = _profiler
+        if profiler is not None:
+            if next(profiler.sampler):
+                start = time.perf_counter()
             else:
-                return ValidationResult(ValidationStatus.WARNING, "Campo vazio ")
+                profiler = None
         
-        try:
-            # Criar instância temporária para validar o campo específico
-            temp_data = {field_name: value}
-            temp_invoice = InvoiceData(**temp_data)
-            
-            # Validações específicas por campo
-            if field_name == 'DocumentType':
-                valid_types = ['Invoice', 'Factura', 'Receipt', 'Recibo', 'Credit Note', 'Nota de Crédito']
-                if value not in valid_types:
-                    return ValidationResult(ValidationStatus.WARNING, f"Tipo não reconhecido: {value}")
-            
-            elif field_name == 'DocumentDate':
-                # Verificar se a data não é muito antiga ou futura
-                try:
-                    date_formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']
-                    parsed_date = None
-                    for fmt in date_formats:
-                        try:
-                            parsed_date = datetime.strptime(value.strip(), fmt)
-                            break
-                        except ValueError:
-                            continue
-                    
-                    if parsed_date:
-                        now = datetime.now()
-                        if parsed_date > now:
-                            return ValidationResult(ValidationStatus.WARNING, "Data no futuro")
-                        elif (now - parsed_date).days > 365 * 5:  # Mais de 5 anos
-                            return ValidationResult(ValidationStatus.WARNING, "Data muito antiga")
-                except:
-                    pass
-            
-            elif field_name in ['TotalDocumentAmount', 'NetDocumentAmount', 'VATAmount']:
-                try:
-                    amount = float(value.replace(',', '.'))
-                    if amount < 0:
-                        return ValidationResult(ValidationStatus.BAD, "Valor não pode ser negativo")
-                    elif amount == 0:
-                        return ValidationResult(ValidationStatus.WARNING, "Valor zero")
-                    
-                    # Verificar consistência entre valores
-                    if field_name == 'TotalDocumentAmount' and 'NetDocumentAmount' in invoice_data and 'VATAmount' in invoice_data:
-                        try:
-                            net = float(invoice_data['NetDocumentAmount'].replace(',', '.'))
-                            vat = float(invoice_data['VATAmount'].replace(',', '.'))
-                            expected_total = net + vat
-                            if abs(amount - expected_total) > 0.01:  # Tolerância de 1 cêntimo
-                                return ValidationResult(ValidationStatus.WARNING, f"Total não confere (esperado: {expected_total:.2f})")
-                        except:
-                            pass
+        if not value or value.strip() == "":
+            if field_name in REQUIRED_FIELDS:
+                result = _REQUIRED_EMPTY
+            else:
+                result = _EMPTY
+        else:
+            try:
+                if check_model and field_name in _MODEL_CHECKED_FIELDS:
+                    # Só o validador do campo, sem construir o modelo inteiro
+                    validator = _MODEL_FIELD_VALIDATORS[field_name]
+                    try:
+                        if profiler is None:
+                            validator(value)
+                        else:
+                            profiler.call(field_name, "model", validator, value)
+                    except ValueError as e:
+                        raise ValueError(_model_error_message(field_name, value, e)) from e
                 
-                except ValueError:
-                    return ValidationResult(ValidationStatus.BAD, "Formato de valor inválido")
-            
-            elif field_name in ['VendorTaxID', 'CustomerTaxID']:
-                cleaned = re.sub(r'[^\d]', '', value)
-                if len(cleaned) != 9:
-                    return ValidationResult(ValidationStatus.BAD, "NIF deve ter 9 dígitos")
+                # Validações específicas por campo (uma única procura na tabela de regras)
+                result = None
+                rule = _FIELD_RULES.get(field_name)
+                if rule is not None:
+                    if profiler is None:
+                        result = rule(value, invoice_data)
+                    else:
+                        rule_start = time.perf_counter()
+                        result = rule(value, invoice_data)
+                        profiler.observe(field_name, _FIELD_RULE_NAMES[field_name], time.perf_counter() - rule_start)
+                if result is None:
+                    result = _VALID
                 
-                # Validação do dígito de controle do NIF português
-                if not InvoiceValidator._validate_portuguese_nif(cleaned):
-                    return ValidationResult(ValidationStatus.BAD, "NIF inválido (dígito de controle)")
-            
-            elif field_name == 'CurrencyCode':
-                valid_currencies = ['EUR', 'USD', 'GBP', 'BRL', 'JPY', 'CHF', 'CAD', 'AUD']
-                if value.upper() not in valid_currencies:
-                    return ValidationResult(ValidationStatus.WARNING, f"Moeda não reconhecida: {value}")
-            
-            return ValidationResult(ValidationStatus.GOOD, "Válido")
-            
-        except ValueError as e:
-            return ValidationResult(ValidationStatus.BAD, str(e))
-        except Exception as e:
-            return ValidationResult(ValidationStatus.WARNING, f"Erro na validação: {str(e)}")
+            except ValueError as e:
+                result = ValidationResult(ValidationStatus.BAD, str(e))
+            except Exception as e:
+                result = ValidationResult(ValidationStatus.WARNING, f"Erro na validação: {str(e)}")
+        
+        if profiler is not None:
+            profiler.observe(field_name, "total", time.perf_counter() - start)
+        return result
     
     @staticmethod
     def _validate_portuguese_nif(nif: str) -> bool:
         """Valida o dígito de controle do NIF português"""
-        if len(nif) != 9:
+        if len(nif) != 9 or not nif.isdigit():
             return False
+        return _checksum_pt(nif)
+
+    @staticmethod
+    def validate_tax_id(value: str, country_code: Optional[str] = None) -> ValidationResult:
+        """Valida um NIF/VAT pelo prefixo de IVA da UE ou, na falta dele, pelo país indicado"""
+        country, number = _resolve_tax_id(value, country_code)
+        validator = TAX_ID_VALIDATORS.get(country)
+        if validator is None:
+            return ValidationResult(ValidationStatus.WARNING, f"Validação de NIF indisponível para o país {country}")
         
-        try:
-            # Algoritmo de validação do NIF português
-            check_digit = int(nif[8])
-            sum_digits = sum(int(nif[i]) * (9 - i) for i in range(8))
-            remainder = sum_digits % 11
-            
-            if remainder < 2:
-                return check_digit == 0
-            else:
-                return check_digit == (11 - remainder)
-        except:
-            return False
+        pattern, checksum = validator
+        if not pattern.fullmatch(number):
+            return _TAX_ID_BAD_PT_LENGTH if country == 'PT' else _TAX_ID_BAD_FORMAT[country]
+        return _VALID if checksum(number) else _TAX_ID_BAD_CHECKSUM
+
+    @staticmethod
+    def validate_tax_ids(values: Iterable[str], country_codes: Optional[Iterable[Optional[str]]] = None) -> List[ValidationResult]:
+        """Valida uma coluna inteira de NIF (com a coluna de países correspondente, se existir)"""
+        values = list(values)
+        countries = [None] * len(values) if country_codes is None else country_codes
+        validate = InvoiceValidator.validate_tax_id
+        return [validate(value, country) for value, country in zip(values, countries)]
     
     @staticmethod
-    def validate_all_fields(invoice_data: Dict[str, Any]) -> Dict[str, ValidationResult]:
+    def validate_all_fields(invoice_data: Dict[str, Any],
+                            cache: Optional[ValidationCache] = None) -> Dict[str, ValidationResult]:
         """Valida todos os campos e retorna um dicionário com os resultados"""
         results = {}
         
-        # Mapear as chaves do formulário para as chaves do modelo Pydantic
-        form_to_model = {
-            "doc_type": "DocumentType",
-            "doc_id": "DocumentID",
-            "doc_date": "DocumentDate",
-            "language": "Language",
-            "currency": "CurrencyCode",
-            "total_amount": "TotalDocumentAmount",
-            "net_amount": "NetDocumentAmount",
-            "vat_amount": "VATAmount",
-            "vendor_name": "VendorName",
-            "vendor_tax_id": "VendorTaxID",
-            "vendor_country": "VendorCountryCode",
-            "customer_name": "CustomerName",
-            "customer_tax_id": "CustomerTaxID",
-            "customer_country": "CustomerCountryCode"
-        }
-        
         # Validar cada campo individualmente
-        for form_key, model_key in form_to_model.items():
+        for form_key, model_key in FORM_TO_MODEL.items():
             value = invoice_data.get(model_key, "")
-            results[form_key] = InvoiceValidator.validate_field(model_key, value, invoice_data)
+            results[form_key] = InvoiceValidator.validate_field(model_key, value, invoice_data, cache)
+        
+        return results
+
+    @staticmethod
+    def affected_fields(changed_fields: Iterable[str]) -> Set[str]:
+        """Retorna os campos alterados mais todos os que dependem deles (transitivamente)"""
+        affected = set()
+        pending = list(changed_fields)
+        while pending:
+            field_name = pending.pop()
+            if field_name in affected:
+                continue
+            affected.add(field_name)
+            pending.extend(_FIELD_DEPENDENTS.get(field_name, ()))
+        return affected
+
+    @staticmethod
+    def revalidate(invoice_data: Dict[str, Any], changed_fields: Iterable[str],
+                   previous_results: Dict[str, ValidationResult],
+                   cache: Optional[ValidationCache] = None) -> Dict[str, ValidationResult]:
+        """Revalida apenas os campos alterados (chaves do modelo) e os seus dependentes"""
+        affected = InvoiceValidator.affected_fields(changed_fields)
+        results = dict(previous_results)
+        
+        for form_key, model_key in FORM_TO_MODEL.items():
+            if model_key in affected or form_key not in results:
+                value = invoice_data.get(model_key, "")
+                results[form_key] = InvoiceValidator.validate_field(model_key, value, invoice_data, cache)
         
         return results
 
+    @staticmethod
+    def validate_many(records: Iterable[Dict[str, Any]],
+                      cache: Optional[ValidationCache] = None,
+                      compact: bool = False) -> Union[List[Dict[str, ValidationResult]], CompactResults]:
+        """Valida um lote de faturas; o modelo Pydantic valida o lote inteiro numa só chamada.
+
+        Com compact=True retorna um CompactResults (um byte de estado por campo) em vez de
+        uma lista de dicionários, o que reduz muito a memória de lotes grandes. O lote é então
+        validado em blocos de COMPACT_CHUNK_SIZE, compactados um a um: os dicionários de
+        resultados de todo o lote nunca existem ao mesmo tempo e o pico de memória também baixa.
+        """
+        if not compact:
+            return InvoiceValidator._validate_batch(records, cache)
+        compact_results = CompactResults()
+        for chunk in chunk_records(records, COMPACT_CHUNK_SIZE):
+            for results in InvoiceValidator._validate_batch(chunk, cache):
+                compact_results.append(results)
+        return compact_results
+
+    @staticmethod
+    def _validate_batch(records: Iterable[Dict[str, Any]],
+                        cache: Optional[ValidationCache]) -> List[Dict[str, ValidationResult]]:
+        all_results = []
+        batch = []
+        model_inputs = []
+        # (campo, valor, contexto) já a caminho da validação neste lote: as repetições esperam pelo
+        # resultado da primeira ocorrência, que entra na cache antes de chegar a vez delas
+        pending_values = set()
+        
+        for invoice_data in records:
+            values = {model_key: invoice_data.get(model_key, "") for model_key in FORM_TO_MODEL.values()}
+            
+            cached = {}
+            contexts = {}
+            if cache is not None:
+                for model_key in CACHEABLE_FIELDS:
+                    value = values[model_key]
+                    if not isinstance(value, str):
+                        continue
+                    context = contexts[model_key] = _cache_context(model_key, value, invoice_data)
+                    if (model_key, value, context) in pending_values:
+                        cached[model_key] = None
+                        continue
+                    result = cache.get(model_key, value, context)
+                    if result is not None:
+                        cached[model_key] = result
+                    else:
+                        pending_values.add((model_key, value, context))
+            
+            # Campos vazios (ou já em cache) não passam pelo modelo
+            model_inputs.append({k: values[k] for k in _MODEL_CHECKED_FIELDS
+                                 if k not in cached and values[k] and values[k].strip() != ""})
+            batch.append((invoice_data, values, cached, contexts))
+        
+        # Uma única chamada ao pydantic-core para todo o lote; mensagens de erro por (registo, campo)
+        field_errors: Dict[Tuple[int, str], str] = {}
+        profiler = _profiler
+        try:
+            if profiler is None:
+                INVOICE_LIST_ADAPTER.validate_python(model_inputs)
+            else:
+                profiler.call("*", "model_batch", INVOICE_LIST_ADAPTER.validate_python, model_inputs)
+        except ValidationError as e:
+            field_errors = _batch_error_messages(e)
+        
+        for index, (invoice_data, values, cached, contexts) in enumerate(batch):
+            results = {}
+            for form_key, model_key in FORM_TO_MODEL.items():
+                if model_key in cached:
+                    result = cached[model_key]
+                    if result is None:
+                        # Repetição de um valor deste lote: a primeira ocorrência já está na cache
+                        result = InvoiceValidator.validate_field(model_key, values[model_key], invoice_data, cache)
+                    results[form_key] = result
+                    continue
+                
+                message = field_errors.get((index, model_key))
+                if message is not None:
+                    result = ValidationResult(ValidationStatus.BAD, message)
+                else:
+                    result = InvoiceValidator._validate_field(
+                        model_key, values[model_key], invoice_data, check_model=False
+                    )
+                results[form_key] = result
+                if model_key in contexts:
+                    cache.put(model_key, values[model_key], result, contexts[model_key])
+            all_results.append(results)
+        
+        return all_results
+
+    @staticmethod
+    def validate_parallel(records: Iterable[Dict[str, Any]], workers: Optional[int] = None,
+                          chunk_size: int = 2000) -> Tuple[CompactResults, Dict[int, Dict[str, float]]]:
+        """Valida um lote grande em paralelo num ProcessPoolExecutor.
+
+        Os registos são enviados em blocos de `chunk_size` (dicionários simples) e cada processo
+        devolve um CompactResults, sem serializar modelos Pydantic. Os resultados são juntos pela
+        ordem original. Retorna (resultados, tempos por processo: blocos, faturas e segundos).
+        """
+        workers = workers or os.cpu_count() or 1
+        results = CompactResults()
+        worker_timings: Dict[int, Dict[str, float]] = {}
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Janela limitada de blocos em curso, para não carregar o lote inteiro em memória
+            pending = deque()
+            for chunk in chunk_records(records, chunk_size):
+                pending.append(executor.submit(_validate_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    InvoiceValidator._merge_chunk(pending.popleft().result(), results, worker_timings)
+            while pending:
+                InvoiceValidator._merge_chunk(pending.popleft().result(), results, worker_timings)
+        
+        return results, worker_timings
+
+    @staticmethod
+    def _merge_chunk(chunk_result: Tuple[CompactResults, int, int, float], results: CompactResults,
+                     worker_timings: Dict[int, Dict[str, float]]) -> None:
+        chunk_results, pid, count, elapsed = chunk_result
+        results.extend(chunk_results)
+        timing = worker_timings.setdefault(pid, {"chunks": 0, "records": 0, "seconds": 0.0})
+        timing["chunks"] += 1
+        timing["records"] += count
+        timing["seconds"] += elapsed
+
     @staticmethod
     def get_status_color(status: ValidationStatus) -> str:
         """Retorna a cor correspondente ao status"""
@@ -245,3 +956,34 @@ class InvoiceValidator:
             ValidationStatus.BAD: "❌"
         }
         return icon_map.get(status, "ℹ️")
+
+def _batch_error_messages(error: ValidationError) -> Dict[Tuple[int, str], str]:
+    """Mensagem de erro de cada (registo, campo) de uma validação em lote, só como texto.
+
+    Os dicionários de e.errors() guardam a exceção original do validador, cujo traceback
+    referencia o frame de validate_many; guardá-los lá criaria um ciclo de referências que
+    mantém o lote inteiro em memória até à próxima recolha completa do GC.
+    """
+    grouped: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+    for detail in error.errors(include_url=False):
+        index, model_key = detail['loc'][0], detail['loc'][1]
+        detail['loc'] = detail['loc'][1:]
+        grouped.setdefault((index, model_key), []).append(detail)
+    # Reconstruir o erro só de cada campo, com a mesma mensagem da validação individual
+    return {key: str(ValidationError.from_exception_data(InvoiceData.__name__, details))
+            for key, details in grouped.items()}
+
+def chunk_records(records: Iterable[Dict[str, Any]], chunk_size: int) -> Iterable[List[Dict[str, Any]]]:
+    """Divide os registos em listas de até chunk_size elementos, de forma preguiçosa"""
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _validate_chunk(records: List[Dict[str, Any]]) -> Tuple[CompactResults, int, int, float]:
+    """Executado em cada processo do pool: valida um bloco e mede o tempo gasto"""
+    start = time.perf_counter()
+    results = InvoiceValidator.validate_many(records, compact=True)
+    return results, os.getpid(), len(records), time.perf_counter() - start
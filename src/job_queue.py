@@ -0,0 +1,154 @@
+"""Fila de jobs persistente (SQLite em modo WAL) para lotes de PDFs retomáveis.
+
+Cada PDF de um lote tem uma linha com o estado (queued, extracting, validating,
+done, failed), o número de tentativas, os tempos de cada fase, os dados extraídos
+e o resultado final. Os dados extraídos são gravados logo que o LLM responde, pelo
+que um lote interrompido é retomado sem voltar a chamar o LLM para os PDFs que já
+tinham sido extraídos: só os que estavam a meio da extração voltam para a fila.
+
+Uma escrita por mudança de estado; o modo WAL com synchronous=NORMAL mantém estas
+escritas baratas e deixa outros processos lerem o progresso enquanto o lote corre.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = "extracting"
+JOB_VALIDATING = "validating"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_STATES = (JOB_QUEUED, JOB_EXTRACTING, JOB_VALIDATING, JOB_DONE, JOB_FAILED)
+
+# Tentativas de extração de cada PDF (somadas entre retomas) antes de desistir
+DEFAULT_MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    batch TEXT NOT NULL,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT NOT NULL DEFAULT '',
+    data TEXT,
+    record TEXT,
+    cached INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL,
+    started_at REAL,
+    extracted_at REAL,
+    finished_at REAL,
+    UNIQUE (batch, path)
+);
+CREATE INDEX IF NOT EXISTS jobs_batch_state ON jobs (batch, state);
+"""
+
+
+class QueuedJob:
+    """Uma linha da fila (só leitura)"""
+    __slots__ = ('id', 'batch', 'path', 'state', 'attempts', 'error', 'data', 'record', 'cached',
+                 'queued_at', 'started_at', 'extracted_at', 'finished_at')
+
+    def __init__(self, row: sqlite3.Row):
+        for name in self.__slots__:
+            setattr(self, name, row[name])
+        self.data = json.loads(self.data) if self.data is not None else None
+        self.record = json.loads(self.record) if self.record is not None else None
+        self.cached = bool(self.cached)
+
+    @property
+    def extraction_seconds(self) -> float:
+        if self.started_at is None or self.extracted_at is None:
+            return 0.0
+        return self.extracted_at - self.started_at
+
+
+class JobQueue:
+    """Fila persistente de PDFs por lote; segura entre threads (uma ligação protegida por lock)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+
+    def _execute(self, sql: str, parameters: Sequence[Any] = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, parameters)
+
+    def _execute_many(self, sql: str, rows: Iterable[Sequence[Any]]) -> None:
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(sql, rows)
+
+    def add(self, batch: str, paths: Iterable[str]) -> int:
+        """Acrescenta os PDFs ao lote (os que já lá estão ficam como estão); retorna quantos são novos"""
+        before = self.total(batch)
+        now = time.time()
+        self._execute_many("INSERT OR IGNORE INTO jobs (batch, path, queued_at) VALUES (?, ?, ?)",
+                           ((batch, path, now) for path in paths))
+        return self.total(batch) - before
+
+    def recover(self, batch: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """Prepara a retoma: extrações interrompidas e falhas com tentativas por usar voltam à fila"""
+        cursor = self._execute(
+            "UPDATE jobs SET state = ?, error = '' WHERE batch = ? AND "
+            "(state = ? OR (state = ? AND data IS NULL AND attempts < ?))",
+            (JOB_QUEUED, batch, JOB_EXTRACTING, JOB_FAILED, max_attempts))
+        return cursor.rowcount
+
+    def jobs(self, batch: str, states: Iterable[str] = JOB_STATES) -> List[QueuedJob]:
+        states = tuple(states)
+        placeholders = ", ".join("?" * len(states))
+        cursor = self._execute(f"SELECT * FROM jobs WHERE batch = ? AND state IN ({placeholders}) ORDER BY path",
+                               (batch,) + states)
+        return [QueuedJob(row) for row in cursor.fetchall()]
+
+    def start_extraction(self, job_ids: Sequence[int]) -> None:
+        now = time.time()
+        self._execute_many("UPDATE jobs SET state = ?, attempts = attempts + 1, started_at = ? WHERE id = ?",
+                           ((JOB_EXTRACTING, now, job_id) for job_id in job_ids))
+
+    def extracted(self, job_id: int, data: Dict[str, Any], cached: bool = False) -> None:
+        """Grava os dados extraídos: a partir daqui o PDF não volta a ser enviado ao LLM"""
+        self._execute("UPDATE jobs SET state = ?, data = ?, cached = ?, extracted_at = ? WHERE id = ?",
+                      (JOB_VALIDATING, json.dumps(data, ensure_ascii=False), int(cached), time.time(), job_id))
+
+    def finish(self, results: Iterable[Tuple[int, Dict[str, Any]]]) -> None:
+        """Marca os jobs como concluídos, com o registo final (extração + validação) de cada um"""
+        now = time.time()
+        self._execute_many("UPDATE jobs SET state = ?, record = ?, finished_at = ? WHERE id = ?",
+                           ((JOB_DONE, json.dumps(record, ensure_ascii=False), now, job_id)
+                            for job_id, record in results))
+
+    def fail(self, job_id: int, error: str, record: Optional[Dict[str, Any]] = None) -> None:
+        self._execute("UPDATE jobs SET state = ?, error = ?, record = ?, finished_at = ? WHERE id = ?",
+                      (JOB_FAILED, error, json.dumps(record, ensure_ascii=False) if record is not None else None,
+                       time.time(), job_id))
+
+    def records(self, batch: str) -> Iterator[Dict[str, Any]]:
+        """Registos finais dos jobs concluídos ou falhados, por ordem do caminho"""
+        for job in self.jobs(batch, (JOB_DONE, JOB_FAILED)):
+            if job.record is not None:
+                yield job.record
+
+    def total(self, batch: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE batch = ?", (batch,)).fetchone()[0]
+
+    def state_counts(self, batch: str) -> Dict[str, int]:
+        counts = dict.fromkeys(JOB_STATES, 0)
+        cursor = self._execute("SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state", (batch,))
+        for state, count in cursor.fetchall():
+            counts[state] = count
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,250 @@
+"""Processamento em lote de PDFs de faturas, sem browser.
+
+Faz o mesmo que a UI (extração pelo servidor ADK, normalização e validação com o
+InvoiceValidator) para uma pasta ou um padrão glob de PDFs, com um número
+limitado de extrações em simultâneo, e escreve uma linha por fatura em JSONL ou
+CSV à medida que avança. No fim mostra o débito e os percentis de latência.
+
+Uso (a partir da pasta src, com o servidor ADK a correr):
+    python process_batch.py faturas/ resultados.jsonl
+    python process_batch.py "arquivo/2024-*/*.pdf" resultados.csv --workers 16
+    python process_batch.py faturas/ resultados.jsonl --queue lotes.sqlite   # retomável
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import requests
+
+from extraction import (APP_NAME, DEFAULT_BATCH_WORKERS, DEFAULT_POOL_MAXSIZE, DEFAULT_TIMEOUT,
+                        GZIP_REQUESTS, SERVER_URL, USER_ID, ADKClient, SessionManager, extract_batch)
+from extraction_cache import DEFAULT_CACHE_DIR, ExtractionCache, agent_fingerprint, prompt_fingerprint
+from invoice_validator import (FORM_TO_MODEL, InvoiceValidator, ValidationResult, ValidationStatus,
+                               normalize_extracted_data)
+from job_queue import DEFAULT_MAX_ATTEMPTS, JOB_QUEUED, JOB_VALIDATING, JobQueue
+from scheduler import scheduler_from_env
+from stream_validation import ResultWriter, is_csv, worst_status
+
+SESSION_PREFIX = "batch"
+# Colunas de cada linha de resultado (em CSV seguem-se os campos do modelo e <campo>_status/_message)
+RESULT_COLUMNS = ("file", "status", "cached", "seconds", "error") + tuple(FORM_TO_MODEL.values())
+# PDFs submetidos (e lidos para memória) de cada vez, por worker; o resto fica só como caminho
+FILES_PER_WORKER = 2
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+def find_pdfs(inputs: Iterable[str], recursive: bool = False) -> List[str]:
+    """Caminhos dos PDFs indicados por pastas, ficheiros ou padrões glob, sem repetições e por ordem"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(item, recursive=True) or [item]
+        for path in candidates:
+            if os.path.isfile(path) and path.lower().endswith('.pdf'):
+                paths.add(os.path.normpath(path))
+    return sorted(paths)
+
+
+def percentile(sorted_values: Sequence[float], percent: float) -> float:
+    """Percentil pelo método nearest-rank (valores já ordenados); 0 se não houver valores"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def result_record(path: str, extraction: Dict[str, Any], invoice_data: Optional[Dict[str, str]],
+                  results: Optional[Dict[str, ValidationResult]]) -> Dict[str, Any]:
+    """Resultado de um PDF (extração e validação de cada campo) como dicionário serializável em JSON"""
+    status = ValidationStatus.BAD if results is None else worst_status(results)
+    record = {"file": path, "status": status.value, "cached": extraction["cached"],
+              "seconds": round(extraction["seconds"], 3), "error": extraction["error"]}
+    if results is not None:
+        record["data"] = invoice_data
+        record["fields"] = {form_key: {"status": result.status.value, "message": result.message}
+                            for form_key, result in results.items()}
+    return record
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    """Conteúdo do PDF; None se não for possível lê-lo"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _validate_chunk(extracted: Sequence[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Valida de uma só vez os PDFs extraídos de um bloco (como a UI faz com os lotes); retorna os registos"""
+    normalized = [normalize_extracted_data(result["data"]) if result["data"] is not None else None
+                  for _, result in extracted]
+    validated = iter(InvoiceValidator.validate_many([data for data in normalized if data is not None]))
+    return [result_record(path, result, invoice_data, next(validated) if invoice_data is not None else None)
+            for (path, result), invoice_data in zip(extracted, normalized)]
+
+
+def process_batch(paths: Sequence[str], output_path: str, sessions: SessionManager,
+                  workers: int = DEFAULT_BATCH_WORKERS, cache: Optional[ExtractionCache] = None,
+                  progress: Optional[TextIO] = None, queue: Optional[JobQueue] = None, batch: str = "",
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Dict[str, Any]:
+    """Extrai e valida os PDFs, escrevendo o resultado de cada um assim que termina.
+
+    Um único pool de workers extrai o lote inteiro; os PDFs são lidos só quando há lugar entre
+    as workers * FILES_PER_WORKER extrações submetidas, pelo que a memória usada não depende do
+    tamanho do lote e um PDF lento não deixa os outros workers parados. Com uma fila (JobQueue), o estado de cada PDF do lote `batch`
+    fica gravado e um lote interrompido é retomado: os PDFs já concluídos passam diretamente
+    da fila para a saída e os já extraídos são só validados, sem nova chamada ao LLM.
+    Retorna estatísticas: contagens, tempo total e latências.
+    """
+    counts = {status.value: 0 for status in ValidationStatus}
+    failed = cached = done = resumed = 0
+    latencies = []
+    start = time.perf_counter()
+
+    def write_records(writer: ResultWriter, records: Iterable[Dict[str, Any]]) -> None:
+        nonlocal failed
+        for record in records:
+            writer.write(record)
+            counts[record["status"]] += 1
+            if "data" not in record:
+                failed += 1
+
+    pending = [(None, path) for path in paths]
+    with open(output_path, 'w', newline='', encoding='utf-8') as output:
+        writer = ResultWriter(output, as_csv=is_csv(output_path), columns=RESULT_COLUMNS)
+        if queue is not None:
+            queue.add(batch, paths)
+            queue.recover(batch, max_attempts)
+            previous = list(queue.records(batch))
+            resumed = len(previous)
+            write_records(writer, previous)
+            # Extraídos antes da interrupção: só falta validar
+            extracted_jobs = queue.jobs(batch, (JOB_VALIDATING,))
+            if extracted_jobs:
+                extracted = [(job.path, {"data": job.data, "error": "", "seconds": job.extraction_seconds,
+                                         "cached": job.cached}) for job in extracted_jobs]
+                records = _validate_chunk(extracted)
+                queue.finish((job.id, record) for job, record in zip(extracted_jobs, records))
+                write_records(writer, records)
+                resumed += len(records)
+            pending = [(job.id, job.path) for job in queue.jobs(batch, (JOB_QUEUED,))]
+            if progress is not None and resumed:
+                progress.write(f"Retomado: {resumed} PDFs já processados, {len(pending)} por processar\n")
+
+        def read_pending() -> Iterator[Tuple[str, Optional[bytes]]]:
+            # Chamado por extract_batch só quando há lugar para mais uma extração
+            for job_id, path in pending:
+                if queue is not None:
+                    queue.start_extraction([job_id])
+                yield path, _read_file(path)
+
+        for index, result in extract_batch(read_pending(), sessions, workers=workers, cache=cache,
+                                           window=max(1, workers) * FILES_PER_WORKER):
+            job_id, path = pending[index]
+            done += 1
+            if result["cached"]:
+                cached += 1
+            elif result["data"] is not None:
+                latencies.append(result["seconds"])
+            if progress is not None:
+                mark = "erro" if result["data"] is None else ("cache" if result["cached"] else "ok")
+                progress.write(f"[{done}/{len(pending)}] {path} ({mark})\n")
+
+            record = _validate_chunk([(path, result)])[0]
+            if queue is not None:
+                if "data" in record:
+                    queue.extracted(job_id, result["data"], result["cached"])
+                    queue.finish([(job_id, record)])
+                else:
+                    queue.fail(job_id, result["error"], record)
+            write_records(writer, [record])
+            output.flush()
+
+    latencies.sort()
+    return {
+        "files": len(paths),
+        "failed": failed,
+        "cached": cached,
+        "resumed": resumed,
+        "status_counts": counts,
+        "seconds": time.perf_counter() - start,
+        "latency": {f"p{p}": percentile(latencies, p) for p in LATENCY_PERCENTILES},
+        "latency_max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Extrai e valida PDFs de faturas em lote (sem a UI)")
+    parser.add_argument("inputs", nargs="+", help="pastas, ficheiros PDF ou padrões glob")
+    parser.add_argument("output", help="ficheiro de resultados (.jsonl ou .csv)")
+    parser.add_argument("--recursive", "-r", action="store_true", help="incluir as subpastas das pastas indicadas")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS,
+                        help=f"extrações em simultâneo (máximo {DEFAULT_POOL_MAXSIZE})")
+    parser.add_argument("--rpm", type=float,
+                        help="máximo de pedidos por minuto ao modelo (por omissão ADK_REQUESTS_PER_MINUTE, ou sem limite)")
+    parser.add_argument("--max-queue", type=int,
+                        help="máximo de extrações à espera de lugar; as restantes falham logo "
+                             "(por omissão ADK_MAX_QUEUE, ou sem limite)")
+    parser.add_argument("--server-url", default=SERVER_URL, help="URL do servidor ADK")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="timeout de cada pedido (segundos)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="pasta da cache de extrações")
+    parser.add_argument("--no-cache", action="store_true", help="não usar a cache de extrações")
+    parser.add_argument("--queue", help="base de dados SQLite da fila de jobs (permite retomar um lote interrompido)")
+    parser.add_argument("--batch", help="nome do lote na fila (por omissão, o ficheiro de resultados)")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="tentativas de extração de cada PDF, somadas entre retomas")
+    parser.add_argument("--quiet", "-q", action="store_true", help="não mostrar o progresso de cada PDF")
+    args = parser.parse_args(argv)
+
+    paths = find_pdfs(args.inputs, recursive=args.recursive)
+    if not paths:
+        print("Nenhum PDF encontrado.", file=sys.stderr)
+        return 2
+
+    workers = min(max(1, args.workers), DEFAULT_POOL_MAXSIZE)
+    client = ADKClient(args.server_url, APP_NAME, USER_ID, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                       gzip_requests=GZIP_REQUESTS, timeout=args.timeout,
+                       scheduler=scheduler_from_env(workers, args.rpm, args.max_queue))
+    try:
+        client.check_connection()
+    except requests.exceptions.RequestException as e:
+        print(f"Não foi possível ligar ao servidor ADK ({args.server_url}): {e}", file=sys.stderr)
+        return 2
+    # O tamanho do contexto não é mostrado num lote noturno
+    sessions = SessionManager(client, prefix=SESSION_PREFIX, measure_context=False)
+    cache = None
+    if not args.no_cache:
+        cache = ExtractionCache(args.cache_dir, prompt=prompt_fingerprint(), model_version=agent_fingerprint())
+
+    queue = JobQueue(args.queue) if args.queue else None
+
+    try:
+        stats = process_batch(paths, args.output, sessions, workers=workers, cache=cache,
+                              progress=None if args.quiet else sys.stderr, queue=queue,
+                              batch=args.batch or os.path.abspath(args.output), max_attempts=args.max_attempts)
+    finally:
+        client.close()
+        if queue is not None:
+            queue.close()
+
+    rate = stats["files"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"{stats['files']} PDFs processados em {stats['seconds']:.1f}s ({rate:.2f} PDFs/s, {workers} workers)")
+    print(f"Estados: {stats['status_counts']} (falhas de extração: {stats['failed']}, da cache: {stats['cached']}, "
+          f"de uma execução anterior: {stats['resumed']})")
+    latency = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in stats["latency"].items())
+    print(f"Latência por extração: {latency}, máx={stats['latency_max']:.2f}s")
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+    print(f"Servidor ADK: {client.stats()}")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Novas tentativas com backoff exponencial e circuit breaker para os pedidos ao servidor ADK.
+
+Um 429 ou 503 passageiro não deve transformar-se numa fatura falhada: o pedido é
+repetido depois de uma espera exponencial com jitter (ou do Retry-After indicado
+pelo servidor). Se o backend do modelo estiver em baixo, o circuit breaker abre
+ao fim de failure_threshold falhas seguidas e os pedidos falham logo, sem esperar
+pelo timeout, até reset_timeout segundos depois; aí um pedido de teste decide se
+o circuito volta a fechar.
+"""
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# 429: limite de pedidos (quota do modelo); 5xx: servidor ou backend do modelo indisponível
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Segundos do cabeçalho Retry-After (só a forma numérica); None se ausente ou inválido"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class RetryPolicy:
+    """Quantas vezes e com que espera repetir um pedido (backoff exponencial com full jitter)"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 retryable_status_codes=RETRYABLE_STATUS_CODES):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable_status_codes = frozenset(retryable_status_codes)
+        self._random = random.Random()
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes da tentativa attempt + 1 (attempt começa em 0)"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter: clientes em simultâneo não repetem todos ao mesmo tempo
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Circuit breaker seguro entre threads, com métricas do tempo passado aberto"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._open_seconds = 0.0
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """O pedido pode seguir? Com o circuito aberto só passa um pedido de teste após reset_timeout"""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+            if self.state == CIRCUIT_HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        """Segundos até o circuito aceitar um pedido de teste"""
+        with self._lock:
+            if self.state != CIRCUIT_OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CIRCUIT_CLOSED:
+                self._open_seconds += time.monotonic() - self._opened_at
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN:
+                # O pedido de teste falhou: volta a abrir por mais reset_timeout segundos
+                self._open_seconds += time.monotonic() - self._opened_at
+                self._open()
+            elif self.state == CIRCUIT_CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = CIRCUIT_OPEN
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._trial_in_progress = False
+
+    @property
+    def open_seconds(self) -> float:
+        """Tempo total com o circuito aberto (ou meio aberto), incluindo o período atual"""
+        with self._lock:
+            current = time.monotonic() - self._opened_at if self.state != CIRCUIT_CLOSED else 0.0
+            return self._open_seconds + current
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "open_seconds": self.open_seconds,
+        }
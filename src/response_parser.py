@@ -0,0 +1,199 @@
+"""Parser incremental e tolerante das respostas JSON do LLM.
+
+O texto da resposta chega aos bocados (streaming SSE do ADK) ou de uma só vez
+(/run). O parser percorre cada carácter uma única vez e devolve cada par
+chave/valor assim que o valor fica completo, para que a UI possa mostrar e
+validar os campos antes de a resposta terminar. Aceita:
+
+- texto e blocos ```json antes, entre e depois do JSON;
+- um objeto, vários objetos seguidos ou uma lista de objetos (uma resposta por
+  página, como pede o prompt), juntando as páginas: fica o primeiro valor não
+  vazio de cada campo;
+- respostas truncadas: os pares completos recebidos até ao corte são mantidos.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_MISSING = object()
+# Literais que o LLM por vezes escreve à maneira do Python
+_BARE_LITERALS = {"None": None, "True": True, "False": False}
+# Chaves de um objeto que embrulha as respostas por página ("pages", "page_1", "página 2", "1", ...)
+_PAGE_KEY = re.compile(r'p[aá]g|^\d+$', re.IGNORECASE)
+
+
+def _is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip() == ""
+    return isinstance(value, (list, dict)) and not value
+
+
+def _loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        stripped = text.strip()
+        if stripped in _BARE_LITERALS:
+            return _BARE_LITERALS[stripped]
+        raise
+
+
+def merge_pages(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Junta respostas por página embrulhadas num objeto ({"pages": [...]} ou {"page_1": {...}})"""
+    pages = []
+    for key, value in fields.items():
+        if not _PAGE_KEY.search(key):
+            # Há campos normais: não é um embrulho de páginas
+            return fields
+        if isinstance(value, dict):
+            pages.append(value)
+        elif isinstance(value, list) and value and all(isinstance(page, dict) for page in value):
+            pages.extend(value)
+        else:
+            return fields
+    merged: Dict[str, Any] = {}
+    for page in pages:
+        for key, value in page.items():
+            if key not in merged or (_is_empty(merged[key]) and not _is_empty(value)):
+                merged[key] = value
+    return merged
+
+
+class IncrementalFieldParser:
+    """Extrai os campos dos objetos JSON de um texto recebido aos bocados"""
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._record_depth = 1
+        self._root_check: Optional[str] = None
+        self._roots = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    @property
+    def complete(self) -> bool:
+        """Pelo menos um objeto (ou lista de objetos) JSON já foi fechado"""
+        return self._roots > 0
+
+    @property
+    def truncated(self) -> bool:
+        """O texto acabou a meio de um objeto JSON"""
+        return bool(self._stack) and self._root_check is None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Acrescenta texto e retorna os pares (chave, valor) novos ou alterados com ele"""
+        self._text += chunk
+        text = self._text
+        new_fields: List[Tuple[str, Any]] = []
+
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._string_closed(pos, new_fields)
+                continue
+
+            if self._root_check is not None:
+                # Logo a seguir a um { ou [ fora do JSON: confirmar que começa mesmo um objeto/lista
+                if char.isspace():
+                    continue
+                if char in self._root_check:
+                    self._root_check = None
+                else:
+                    self._stack.clear()
+                    self._root_check = None
+
+            if not self._stack:
+                # Fora do JSON: preâmbulo, ```json, texto entre páginas, etc.
+                if char == '{':
+                    self._stack.append(char)
+                    self._record_depth = 1
+                    self._expect_key = True
+                    self._root_check = '"}'
+                elif char == '[':
+                    self._stack.append(char)
+                    self._record_depth = 2
+                    self._root_check = '{]'
+                continue
+
+            depth = len(self._stack)
+            at_field_level = depth == self._record_depth and self._stack[-1] == '{'
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+                if at_field_level and not self._expect_key and self._value_start is None:
+                    self._value_start = pos
+            elif char in '{[':
+                if at_field_level and self._value_start is None:
+                    self._value_start = pos
+                elif depth == self._record_depth - 1 and char == '{':
+                    # Início de mais uma página numa lista de objetos
+                    self._expect_key = True
+                self._stack.append(char)
+            elif char in '}]':
+                if at_field_level:
+                    # Fim do objeto: um valor escalar pendente termina aqui
+                    self._emit(self._value_start, pos, new_fields)
+                self._stack.pop()
+                if not self._stack:
+                    self._roots += 1
+                elif len(self._stack) == self._record_depth and self._stack[-1] == '{' \
+                        and self._value_start is not None:
+                    self._emit(self._value_start, pos + 1, new_fields)
+            elif at_field_level:
+                if char == ':':
+                    self._expect_key = False
+                elif char == ',':
+                    self._emit(self._value_start, pos, new_fields)
+                    self._expect_key = True
+                elif not char.isspace() and not self._expect_key and self._value_start is None:
+                    # Início de um número, true, false ou null
+                    self._value_start = pos
+
+        self._pos = len(text)
+        return new_fields
+
+    def finish(self) -> Dict[str, Any]:
+        """Fim do texto: retorna os campos recuperados (um valor cortado a meio é descartado)"""
+        return merge_pages(self.fields)
+
+    def _string_closed(self, pos: int, new_fields: List[Tuple[str, Any]]) -> None:
+        if len(self._stack) != self._record_depth or self._stack[-1] != '{':
+            return
+        if self._expect_key:
+            self._key = json.loads(self._text[self._string_start:pos + 1])
+        elif self._value_start == self._string_start:
+            self._emit(self._value_start, pos + 1, new_fields)
+
+    def _emit(self, start: Optional[int], end: int, new_fields: List[Tuple[str, Any]]) -> None:
+        key, self._key, self._value_start = self._key, None, None
+        if key is None or start is None:
+            return
+        try:
+            value = _loads(self._text[start:end])
+        except ValueError:
+            return
+        current = self.fields.get(key, _MISSING)
+        if current is _MISSING or (_is_empty(current) and not _is_empty(value)):
+            self.fields[key] = value
+            new_fields.append((key, value))
+
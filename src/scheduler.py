@@ -0,0 +1,203 @@
+"""Controlo do débito de pedidos ao backend do modelo: concorrência máxima e pedidos por minuto.
+
+Com extrações em paralelo (lotes da UI, jobs em segundo plano, process_batch,
+watch_folder) nada impedia que o servidor ADK e a quota do modelo recebessem mais
+pedidos do que aguentam, o que acaba em 429. O ExtractionScheduler fica à frente
+de todas as chamadas de extração: limita os pedidos em curso (ConcurrencyLimiter)
+e o ritmo de envio (TokenBucket, pedidos por minuto com rajadas até burst). O que
+passa dos limites espera numa fila; se a fila estiver cheia, o pedido é recusado
+logo (backpressure) em vez de se acumular.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class ConcurrencyLimiter:
+    """Semáforo com limite ajustável a qualquer momento (os que esperam são acordados)"""
+
+    def __init__(self, limit: int):
+        self._limit = max(1, limit)
+        self.active = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @limit.setter
+    def limit(self, value: int) -> None:
+        with self._condition:
+            self._limit = max(1, value)
+            self._condition.notify_all()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.active < self._limit, timeout):
+                return False
+            self.active += 1
+            return True
+
+    def release(self) -> None:
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class TokenBucket:
+    """Token bucket: rate tokens por segundo, até capacity acumulados"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Retira um token (mesmo que ainda não exista) e retorna quanto tempo esperar por ele.
+
+        Reservar em vez de esperar e tentar de novo mantém a ordem de chegada e evita que
+        várias threads acordem ao mesmo tempo para o mesmo token.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class ExtractionScheduler:
+    """Concorrência máxima + pedidos por minuto, com fila limitada e métricas de espera.
+
+    Uso: `with scheduler.slot():` à volta de toda a extração (conta para max_in_flight) e
+    scheduler.wait_for_token() antes de cada pedido HTTP ao modelo, incluindo as novas
+    tentativas (cada uma conta para a quota). requests_per_minute=None não limita o ritmo.
+    """
+
+    def __init__(self, max_in_flight: int, requests_per_minute: Optional[float] = None,
+                 burst: Optional[int] = None, max_queue: Optional[int] = None, history: int = 1000):
+        self.limiter = ConcurrencyLimiter(max_in_flight)
+        self.bucket = None
+        if requests_per_minute:
+            self.bucket = TokenBucket(requests_per_minute / 60.0, burst or max_in_flight)
+        self.max_queue = max_queue
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+        self.rate_wait_seconds = 0.0
+        self.recent_waits = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self.limiter.active
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Espera por um lugar entre os pedidos em curso; False se a fila estiver cheia ou passar o timeout"""
+        # Com um lugar livre não há fila (nem limite de fila) a respeitar
+        if self.limiter.acquire(0):
+            self._admit(0.0)
+            return True
+        with self._lock:
+            if self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        start = time.monotonic()
+        acquired = False
+        try:
+            acquired = self.limiter.acquire(timeout)
+        finally:
+            waited = time.monotonic() - start
+            with self._lock:
+                self.queued -= 1
+                if not acquired:
+                    self.rejected += 1
+        if acquired:
+            self._admit(waited)
+        return acquired
+
+    def _admit(self, waited: float) -> None:
+        with self._lock:
+            self.admitted += 1
+            self.wait_seconds += waited
+            self.recent_waits.append(waited)
+
+    def release(self) -> None:
+        self.limiter.release()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[bool]:
+        """Contexto com um lugar entre os pedidos em curso; produz False (sem lugar) se foi recusado"""
+        acquired = self.acquire(timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release()
+
+    def wait_for_token(self) -> float:
+        """Espera pela vez deste pedido no limite de pedidos por minuto; retorna o tempo esperado"""
+        if self.bucket is None:
+            return 0.0
+        delay = self.bucket.reserve()
+        if delay > 0:
+            time.sleep(delay)
+            with self._lock:
+                self.rate_limited += 1
+                self.rate_wait_seconds += delay
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self.recent_waits)
+            stats = {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.limiter.limit,
+                "queue_depth": self.queued,
+                "max_queue_depth": self.max_queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "wait_seconds": self.wait_seconds,
+                "rate_limited": self.rate_limited,
+                "rate_wait_seconds": self.rate_wait_seconds,
+            }
+        stats["p50_wait"] = waits[len(waits) // 2] if waits else 0.0
+        stats["p95_wait"] = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return stats
+
+
+def scheduler_from_env(max_in_flight: int, requests_per_minute: Optional[float] = None,
+                       max_queue: Optional[int] = None) -> ExtractionScheduler:
+    """Scheduler configurado pelas variáveis ADK_MAX_IN_FLIGHT, ADK_REQUESTS_PER_MINUTE, ADK_RATE_BURST e ADK_MAX_QUEUE.
+
+    max_in_flight é o valor a usar quando ADK_MAX_IN_FLIGHT não está definida; requests_per_minute
+    e max_queue, quando indicados (opções --rpm e --max-queue dos scripts), têm precedência sobre
+    as variáveis. Para correr no limite da quota, ADK_REQUESTS_PER_MINUTE deve ser a quota do
+    modelo (ou um pouco abaixo, se outros clientes usarem a mesma chave). ADK_MAX_QUEUE limita as
+    extrações à espera de lugar (0: recusar logo se não houver lugar); sem ela, a fila não tem limite.
+    """
+    max_in_flight = int(os.environ.get("ADK_MAX_IN_FLIGHT", max_in_flight))
+    if requests_per_minute is None:
+        requests_per_minute = float(os.environ.get("ADK_REQUESTS_PER_MINUTE", 0)) or None
+    burst = int(os.environ.get("ADK_RATE_BURST", 0)) or None
+    if max_queue is None and os.environ.get("ADK_MAX_QUEUE"):
+        max_queue = int(os.environ["ADK_MAX_QUEUE"])
+    return ExtractionScheduler(max_in_flight, requests_per_minute or None, burst=burst, max_queue=max_queue)
@@ -0,0 +1,160 @@
+"""Validação em streaming de exportações de faturas (JSONL ou CSV).
+
+Lê os registos de forma preguiçosa, valida-os em blocos e escreve os resultados
+à medida que avança, pelo que a memória usada não depende do tamanho do ficheiro.
+
+Uso (a partir da pasta src):
+    python stream_validation.py faturas.jsonl resultados.jsonl
+    python stream_validation.py export_erp.csv resultados.csv --chunk-size 5000
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from typing import Any, Dict, Iterator, Optional, Sequence, TextIO
+
+from invoice_validator import (FORM_TO_MODEL, InvoiceValidator, ValidationCache, ValidationResult,
+                               ValidationStatus, chunk_records, normalize_extracted_data)
+
+CSV_EXTENSIONS = ('.csv', '.tsv')
+STATUS_SEVERITY = {ValidationStatus.GOOD: 0, ValidationStatus.WARNING: 1, ValidationStatus.BAD: 2}
+# Colunas de cada linha de resultado (em CSV seguem-se <campo>_status e <campo>_message)
+RESULT_COLUMNS = ("record", "DocumentID", "status", "error")
+
+
+def is_csv(path: str) -> bool:
+    return path.lower().endswith(CSV_EXTENSIONS)
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Lê as faturas de um ficheiro JSONL ou CSV, uma de cada vez.
+
+    Linhas JSON inválidas produzem um registo com a chave "_error" em vez de interromper a leitura.
+    """
+    if is_csv(path):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            for row in csv.DictReader(f, dialect=dialect):
+                yield normalize_extracted_data(row)
+        return
+
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"_error": f"Linha {line_number}: JSON inválido ({e})"}
+                continue
+            if not isinstance(raw, dict):
+                yield {"_error": f"Linha {line_number}: esperado um objeto JSON"}
+                continue
+            yield normalize_extracted_data(raw)
+
+
+def worst_status(results: Dict[str, ValidationResult]) -> ValidationStatus:
+    """Estado global de uma fatura: o pior estado entre os campos"""
+    return max((result.status for result in results.values()),
+               key=STATUS_SEVERITY.__getitem__, default=ValidationStatus.GOOD)
+
+
+class ResultWriter:
+    """Escreve uma linha por resultado em JSONL ou CSV (pelo nome do ficheiro de saída).
+
+    Cada resultado é um dicionário serializável em JSON. Em CSV, as chaves de columns dão uma
+    coluna cada, os valores em "data" (campos do modelo) preenchem as colunas com o mesmo nome
+    e cada campo em "fields" dá as colunas <campo>_status e <campo>_message.
+    """
+
+    def __init__(self, output: TextIO, as_csv: bool, columns: Sequence[str] = RESULT_COLUMNS):
+        self.output = output
+        self.columns = tuple(columns)
+        self.csv_writer = None
+        if as_csv:
+            fieldnames = list(self.columns)
+            for form_key in FORM_TO_MODEL:
+                fieldnames += [f"{form_key}_status", f"{form_key}_message"]
+            self.csv_writer = csv.DictWriter(output, fieldnames=fieldnames)
+            self.csv_writer.writeheader()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.csv_writer is None:
+            self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+
+        row = {key: record.get(key, "") for key in self.columns}
+        row.update(record.get("data") or {})
+        for form_key, field in (record.get("fields") or {}).items():
+            row[f"{form_key}_status"] = field["status"]
+            row[f"{form_key}_message"] = field["message"]
+        self.csv_writer.writerow(row)
+
+
+def validation_record(index: int, record: Dict[str, Any],
+                      results: Optional[Dict[str, ValidationResult]]) -> Dict[str, Any]:
+    """Resultado de uma fatura do ficheiro; results=None para os registos ilegíveis (com "_error")"""
+    row = {"record": index, "DocumentID": record.get("DocumentID", "")}
+    if results is None:
+        row.update(status=ValidationStatus.BAD.value, error=record["_error"])
+    else:
+        row["status"] = worst_status(results).value
+        row["fields"] = {form_key: {"status": result.status.value, "message": result.message}
+                         for form_key, result in results.items()}
+    return row
+
+
+def validate_stream(input_path: str, output_path: str, chunk_size: int = 1000,
+                    cache: Optional[ValidationCache] = None) -> Dict[str, Any]:
+    """Valida um ficheiro de faturas em blocos e escreve os resultados incrementalmente.
+
+    Retorna estatísticas: número de faturas, contagem por estado global e tempo gasto.
+    """
+    counts = {status.value: 0 for status in ValidationStatus}
+    total = 0
+    start = time.perf_counter()
+
+    with open(output_path, 'w', newline='', encoding='utf-8') as output:
+        writer = ResultWriter(output, as_csv=is_csv(output_path))
+        for chunk in chunk_records(iter_records(input_path), chunk_size):
+            valid_records = [record for record in chunk if "_error" not in record]
+            validated = iter(InvoiceValidator.validate_many(valid_records, cache=cache))
+            for record in chunk:
+                results = None if "_error" in record else next(validated)
+                row = validation_record(total, record, results)
+                writer.write(row)
+                counts[row["status"]] += 1
+                total += 1
+            output.flush()
+
+    return {"records": total, "status_counts": counts, "seconds": time.perf_counter() - start}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Valida exportações de faturas (JSONL/CSV) em streaming")
+    parser.add_argument("input", help="ficheiro de entrada (.jsonl ou .csv)")
+    parser.add_argument("output", help="ficheiro de resultados (.jsonl ou .csv)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="faturas validadas por bloco")
+    parser.add_argument("--cache-size", type=int, default=65536,
+                        help="entradas da cache de resultados (0 para desligar)")
+    args = parser.parse_args(argv)
+
+    cache = ValidationCache(args.cache_size) if args.cache_size > 0 else None
+    stats = validate_stream(args.input, args.output, chunk_size=args.chunk_size, cache=cache)
+    rate = stats["records"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"{stats['records']} faturas validadas em {stats['seconds']:.1f}s ({rate:.0f} faturas/s)")
+    print(f"Estados: {stats['status_counts']}")
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
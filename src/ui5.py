@@ -3,6 +3,7 @@ import requests
 import base64
 import json
 import io
+import time
 
 # Importar o validador
 try:
@@ -12,6 +13,13 @@ except ImportError:
     VALIDATOR_AVAILABLE = False
     st.warning("⚠️ invoice_validator.py não encontrado. Validação desabilitada.")
 
+from extraction import APP_NAME, DEFAULT_BATCH_WORKERS, DEFAULT_POOL_MAXSIZE, GZIP_REQUESTS, SERVER_URL, USER_ID, \
+    ADKClient, SessionManager
+from extraction_cache import ExtractionCache, agent_fingerprint, pdf_digest, prompt_fingerprint
+from extraction_jobs import FINISHED_STATUSES, JOB_FAILED, JOB_PENDING, JOB_RUNNING, ExtractionJobStore
+from invoice_validator import normalize_extracted_data
+from scheduler import scheduler_from_env
+
 # Configure page
 st.set_page_config(page_title="Invoice Processor", page_icon="📄", layout="wide")
 
@@ -31,11 +39,37 @@ st.markdown("""
 
 st.title("📄 Processador automático de Faturas")
 
-# Configurações do servidor
-SERVER_URL = "http://localhost:8000"
-APP_NAME = "invoices"
-USER_ID = "user0"
-SESSION_ID = "session0"
+# Configurações do servidor: SERVER_URL, APP_NAME, USER_ID e GZIP_REQUESTS vêm de extraction.py
+SESSION_PREFIX = "extract" # Cada extração usa uma sessão nova "extract-<uuid>", apagada no fim
+
+@st.cache_resource
+def get_adk_client():
+    """Cliente HTTP com pool de ligações keep-alive, partilhado entre sessões e reruns.
+
+    O scheduler (limites de pedidos em curso e por minuto, ver scheduler_from_env) é o mesmo
+    para todos os utilizadores da app, já que a quota do modelo também é.
+    """
+    return ADKClient(SERVER_URL, APP_NAME, USER_ID, pool_maxsize=DEFAULT_POOL_MAXSIZE, gzip_requests=GZIP_REQUESTS,
+                     scheduler=scheduler_from_env(DEFAULT_POOL_MAXSIZE))
+
+@st.cache_resource
+def get_session_manager():
+    """Gestor das sessões ADK por extração (partilhado, para o TTL e as estatísticas)"""
+    return SessionManager(get_adk_client(), prefix=SESSION_PREFIX)
+
+@st.cache_resource
+def get_extraction_cache():
+    """Cache de extrações partilhada entre sessões e reruns (contadores incluídos)"""
+    return ExtractionCache(prompt=prompt_fingerprint(), model_version=agent_fingerprint())
+
+# Intervalo (segundos) entre consultas ao estado dos jobs de extração
+JOB_POLL_INTERVAL = 2
+
+@st.cache_resource
+def get_job_store():
+    """Jobs de extração em segundo plano; os resultados sobrevivem a reruns e religações"""
+    # O lote é reposto a partir dos jobs depois de recarregar a página, incluindo os PDFs
+    return ExtractionJobStore(get_session_manager(), cache=get_extraction_cache(), keep_pdf_bytes=True)
 
 # --- NEW: Define all available fields and categories ---
 ALL_AVAILABLE_FIELDS = {
@@ -87,21 +121,19 @@ if 'selected_preset_name' not in st.session_state:
     st.session_state.selected_preset_name = "Default (Todos os Campos)"
 if 'fields_to_display' not in st.session_state:
     st.session_state.fields_to_display = PRESETS["Default (Todos os Campos)"]
+if 'batch_results' not in st.session_state: # Um dicionário por PDF do lote (dados, validação, erro)
+    st.session_state.batch_results = []
+if 'batch_index' not in st.session_state: # Fatura do lote atualmente em revisão
+    st.session_state.batch_index = None
 
-# Função para criar uma sessão (igual ao fornecido)
+# Verifica a ligação ao servidor (as sessões ADK são criadas por extração, no SessionManager)
 def create_session():
     try:
-        session_url = f"{SERVER_URL}/apps/{APP_NAME}/users/{USER_ID}/sessions/{SESSION_ID}"
-        payload = json.dumps({"state": {}})
-        headers = {'Content-Type': 'application/json'}
-        response = requests.get(session_url, headers=headers)
-        if response.status_code == 404:
-            response = requests.post(session_url, headers=headers, data=payload)
-            response.raise_for_status()
+        get_adk_client().check_connection()
         st.session_state.session_created = True
         return True
     except requests.exceptions.RequestException as e:
-        st.error(f"Erro de rede ao tentar criar/verificar sessão: {e}")
+        st.error(f"Erro de rede ao tentar ligar ao servidor: {e}")
         st.session_state.session_created = False
         return False
     except Exception as e:
@@ -110,11 +142,127 @@ def create_session():
         return False
 
 # Função para validar dados (igual ao fornecido, mas agora relies on invoice_data being correctly populated)
-def validate_invoice_data():
+def validate_invoice_data(changed_fields=None):
     if VALIDATOR_AVAILABLE and st.session_state.invoice_data:
         # invoice_validator.validate_all_fields expects invoice_data keyed by model_key
         # and returns results keyed by form_key
-        st.session_state.validation_results = InvoiceValidator.validate_all_fields(st.session_state.invoice_data)
+        if changed_fields and st.session_state.validation_results:
+            # Só revalida os campos alterados (model_key) e os que dependem deles
+            st.session_state.validation_results = InvoiceValidator.revalidate(
+                st.session_state.invoice_data, changed_fields, st.session_state.validation_results
+            )
+        else:
+            st.session_state.validation_results = InvoiceValidator.validate_all_fields(st.session_state.invoice_data)
+        if st.session_state.batch_index is not None:
+            # Em modo lote, a fatura em revisão guarda os resultados atualizados
+            st.session_state.batch_results[st.session_state.batch_index]["validation_results"] = st.session_state.validation_results
+
+# Carrega uma fatura do lote no formulário de revisão
+def select_batch_item(index):
+    item = st.session_state.batch_results[index]
+    st.session_state.batch_index = index
+    st.session_state.pdf_filename = item["filename"]
+    st.session_state.uploaded_pdf = item["pdf_bytes"]
+    st.session_state.invoice_data = item["invoice_data"] # Mesmo objeto: as edições ficam no lote
+    st.session_state.validation_results = item["validation_results"]
+    # Os campos de texto guardam o valor anterior pela key; limpar para mostrar a nova fatura
+    for form_key in ALL_AVAILABLE_FIELDS:
+        st.session_state.pop(form_key, None)
+
+# Submete os PDFs como jobs de extração em segundo plano (não bloqueia a página)
+def submit_extraction_jobs(files):
+    store = get_job_store()
+    stream = st.session_state.get("stream_extraction", False)
+    st.session_state.batch_results = [
+        {"filename": name, "job_id": store.submit(name, pdf_bytes, stream=stream), "pdf_bytes": pdf_bytes, "status": JOB_PENDING,
+         "invoice_data": {}, "validation_results": {}, "error": "", "seconds": 0.0, "cached": False}
+        for name, pdf_bytes in files
+    ]
+    st.session_state.batch_index = None
+    st.session_state.batch_started_at = time.time()
+    # Os IDs ficam no URL: após recarregar a página ou religar o browser, os resultados são recuperados
+    st.query_params["jobs"] = ",".join(item["job_id"] for item in st.session_state.batch_results)
+
+# Recupera os jobs indicados no URL (nova sessão do browser com jobs ainda guardados no servidor)
+def restore_extraction_jobs():
+    if st.session_state.batch_results or "jobs" not in st.query_params:
+        return
+    jobs = [job for job in get_job_store().get_many(st.query_params["jobs"].split(",")) if job is not None]
+    st.session_state.batch_results = [
+        {"filename": job.filename, "job_id": job.id, "pdf_bytes": job.pdf_bytes, "status": JOB_PENDING,
+         "invoice_data": {}, "validation_results": {}, "error": "", "seconds": 0.0, "cached": False}
+        for job in jobs
+    ]
+    if jobs:
+        st.session_state.batch_started_at = min(job.submitted_at for job in jobs)
+
+# Copia os jobs terminados para o lote e valida-os; retorna quantos terminaram desde a última consulta
+def collect_finished_jobs():
+    batch = st.session_state.batch_results
+    waiting = [item for item in batch if item["status"] not in FINISHED_STATUSES]
+    finished = []
+    for item, job in zip(waiting, get_job_store().get_many(item["job_id"] for item in waiting)):
+        if job is None:
+            item.update(status=JOB_FAILED, error="Job de extração expirado ou desconhecido.")
+        elif job.finished:
+            item.update(status=job.status, error=job.error, seconds=job.seconds, cached=job.cached,
+                        finished_at=job.finished_at)
+            if job.data is not None:
+                item["invoice_data"] = normalize_extracted_data(job.data)
+                finished.append(item)
+        else:
+            item["status"] = job.status
+
+    if VALIDATOR_AVAILABLE and finished:
+        for item, results in zip(finished, InvoiceValidator.validate_many([item["invoice_data"] for item in finished])):
+            item["validation_results"] = results
+    if st.session_state.batch_index is None and finished:
+        select_batch_item(batch.index(finished[0]))
+    return len(finished) + sum(1 for item in waiting if item["status"] == JOB_FAILED)
+
+# Progresso dos jobs, atualizado periodicamente sem bloquear o resto da página
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress():
+    if collect_finished_jobs():
+        st.rerun() # Atualiza a lista de faturas e o formulário com os novos resultados
+    batch = st.session_state.batch_results
+    done = sum(1 for item in batch if item["status"] in FINISHED_STATUSES)
+    st.progress(done / len(batch), text=f"🔄 {done} de {len(batch)} faturas processadas")
+    job_icons = {JOB_PENDING: "⏳", JOB_RUNNING: "🔄"}
+    lines, streaming = [], []
+    for item, job in zip(batch, get_job_store().get_many(item["job_id"] for item in batch)):
+        if job is not None and not job.finished:
+            lines.append(f"- {job_icons[job.status]} {item['filename']} ({job.seconds:.0f} s)")
+            if job.partial:
+                streaming.append((item["filename"], dict(job.partial)))
+    st.markdown("\n".join(lines))
+    for filename, partial in streaming:
+        show_partial_fields(filename, partial, expanded=len(streaming) == 1)
+
+# Campos já recebidos em streaming, validados à medida que chegam
+def show_partial_fields(filename, partial, expanded):
+    partial_data = normalize_extracted_data(partial)
+    with st.expander(f"⚡ {filename}: {len(partial)} de {len(ALL_AVAILABLE_FIELDS)} campos recebidos", expanded=expanded):
+        for config in ALL_AVAILABLE_FIELDS.values():
+            model_key = config["model_key"]
+            if model_key not in partial:
+                continue
+            icon = ""
+            if VALIDATOR_AVAILABLE:
+                result = InvoiceValidator.validate_field(model_key, partial_data[model_key], partial_data)
+                icon = InvoiceValidator.get_status_icon(result.status)
+            st.markdown(f"{icon} **{config['label']}:** {partial_data[model_key]}")
+
+# Ícone do pior estado de validação de uma fatura do lote
+def batch_item_icon(item):
+    if item["error"]:
+        return "❌"
+    statuses = {result.status for result in item["validation_results"].values()} if VALIDATOR_AVAILABLE else set()
+    if VALIDATOR_AVAILABLE and ValidationStatus.BAD in statuses:
+        return "🔴"
+    if VALIDATOR_AVAILABLE and ValidationStatus.WARNING in statuses:
+        return "🟡"
+    return "🟢"
 
 # Função para mostrar resumo de validação (igual ao fornecido)
 def show_validation_summary():
@@ -156,7 +304,7 @@ def create_validated_field(label, form_key, current_value=""):
 
 # --- MODIFIED: Função para processar o formulário de edição ---
 def process_form_submission():
-    form_updated = False
+    changed_fields = []
     # Iterate only through fields that were displayed and thus potentially edited
     for form_key in st.session_state.get("fields_to_display", []):
         if form_key in st.session_state and form_key in ALL_AVAILABLE_FIELDS: # Check if input widget exists and config is available
@@ -166,10 +314,10 @@ def process_form_submission():
             current_invoice_data_value = st.session_state.invoice_data.get(model_key)
             if current_invoice_data_value != new_value_from_input and new_value_from_input is not None:
                 st.session_state.invoice_data[model_key] = new_value_from_input
-                form_updated = True
+                changed_fields.append(model_key)
     
-    if form_updated:
-        validate_invoice_data()
+    if changed_fields:
+        validate_invoice_data(changed_fields)
         st.success("Dados atualizados com sucesso!")
     else:
         st.info("Nenhuma alteração detectada nos dados para os campos exibidos.")
@@ -239,69 +387,99 @@ with st.sidebar:
             st.session_state.fields_to_display = selected_custom_fields
             # st.rerun() # Rerun if multiselect changes for immediate form update
 
+    st.markdown("---")
+    st.header("📚 Modo de Processamento")
+    processing_mode = st.radio("Processar:", ["Fatura única", "Lote de faturas"], key="processing_mode")
+    if processing_mode == "Lote de faturas":
+        batch_workers = st.slider("Extrações em paralelo", min_value=1, max_value=DEFAULT_POOL_MAXSIZE, value=DEFAULT_BATCH_WORKERS,
+                                  help="Número de faturas enviadas ao servidor ao mesmo tempo")
+    st.checkbox("⚡ Extração em streaming (SSE)", key="stream_extraction",
+                help="Mostra e valida cada campo assim que o servidor o envia, antes de a fatura terminar")
+
+    st.markdown("---")
+    cache_stats = get_extraction_cache().stats()
+    st.caption(f"🗄️ Cache de extrações: {cache_stats['entries']} faturas, "
+               f"{cache_stats['hits']} hits / {cache_stats['misses']} misses "
+               f"({cache_stats['bytes'] / 1024 / 1024:.1f} MB)")
+    session_stats = get_session_manager().stats()
+    st.caption(f"🧵 Sessões ADK: {session_stats['active']} ativas, {session_stats['created']} criadas. "
+               f"Contexto médio por extração: {session_stats['mean_events']:.1f} eventos, "
+               f"{session_stats['mean_text_chars']:.0f} caracteres de texto")
+    client_stats = get_adk_client().stats()
+    circuit = client_stats["circuit"]
+    circuit_label = {"closed": "fechado", "open": "aberto", "half_open": "em teste"}[circuit["state"]]
+    st.caption(f"🔁 Novas tentativas: {client_stats['retries']} ({client_stats['retry_wait_seconds']:.0f}s de espera). "
+               f"Circuito {circuit_label}, aberto {circuit['opened']} vezes "
+               f"({circuit['open_seconds']:.0f}s, {circuit['rejected']} pedidos recusados)")
+    scheduler_stats = client_stats["scheduler"]
+    st.caption(f"🚦 Modelo: {scheduler_stats['in_flight']}/{scheduler_stats['max_in_flight']} pedidos em curso, "
+               f"{scheduler_stats['queue_depth']} em espera (espera p95 {scheduler_stats['p95_wait']:.1f}s, "
+               f"{scheduler_stats['rate_wait_seconds']:.0f}s à espera do limite por minuto)")
+
 # Conteúdo principal
 if st.session_state.session_created:
-    st.header("📤 Upload da Fatura")
-    if not st.session_state.uploaded_pdf:
-        st.info("👆 Carregue um ficheiro PDF com a fatura para começar o processamento.")
-    
-    uploaded_file = st.file_uploader("Selecione o arquivo PDF da fatura", type=['pdf'], help="Apenas ficheiros PDF são aceites")
-
-    if uploaded_file is not None:
-        # Check if it's a new file or the same one to avoid reprocessing without need
-        # This simple check relies on filename and size; more robust would be hashing content
-        new_file_identifier = (uploaded_file.name, uploaded_file.size)
-        if st.session_state.get("last_uploaded_file_identifier") != new_file_identifier:
-            st.session_state.pdf_filename = uploaded_file.name
-            st.session_state.last_uploaded_file_identifier = new_file_identifier # Store identifier of processed file
-            
-            with st.spinner("🔄 Processando a sua fatura... Pode levar alguns segundos."):
-                try:
-                    pdf_bytes = uploaded_file.getvalue()
-                    pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
-                    payload = { # Payload structure as per original
-                        "app_name": APP_NAME, "user_id": USER_ID, "session_id": SESSION_ID,
-                        "new_message": {
-                            "role": "user",
-                            "parts": [{"text": "Extract information from invoice"}, {"inline_data": {"mime_type": "application/pdf", "data": pdf_base64}}]
-                        }
-                    }
-                    headers = {'Content-Type': 'application/json'}
-                    response = requests.post(f"{SERVER_URL}/run", headers=headers, data=json.dumps(payload), timeout=90)
-                    response.raise_for_status()
-                    response_data = response.json()
-
-                    # Simplified response parsing based on original structure
-                    if isinstance(response_data, list) and response_data and 'content' in response_data[0] and 'parts' in response_data[0]['content'] and response_data[0]['content']['parts'] and 'text' in response_data[0]['content']['parts'][0]:
-                        json_string_with_fences = response_data[0]['content']['parts'][0]['text']
-                        start_index = json_string_with_fences.find('{')
-                        end_index = json_string_with_fences.rfind('}')
-                        if start_index != -1 and end_index != -1 and end_index > start_index:
-                            cleaned_json_string = json_string_with_fences[start_index:end_index + 1]
-                            extracted_data_from_llm = json.loads(cleaned_json_string) # Keys are expected to be model_keys
-
-                            if isinstance(extracted_data_from_llm, dict):
-                                st.session_state.uploaded_pdf = pdf_bytes
-                                st.session_state.invoice_data = {} # Clear previous
-
-                                # Populate st.session_state.invoice_data using model_keys
-                                # Assumes LLM returns data with keys that match 'model_key' definitions
-                                for form_key_iter, config in ALL_AVAILABLE_FIELDS.items():
-                                    model_key_iter = config["model_key"]
-                                    value_from_llm = extracted_data_from_llm.get(model_key_iter)
-                                    st.session_state.invoice_data[model_key_iter] = "" if value_from_llm is None else str(value_from_llm)
-                                
-                                validate_invoice_data()
-                                st.success("✅ Fatura processada com sucesso! Dados extraídos e validados.")
-                                st.rerun() # Rerun to update form with new data
-                            else: st.error("❌ Formato de dados inválido extraído da fatura.")
-                        else: st.error("❌ Não foi possível extrair dados JSON válidos da fatura.")
-                    else: st.error("❌ Resposta inesperada do servidor de processamento.")
-                except requests.exceptions.Timeout: st.error("⏱️ Timeout: O servidor demorou muito para responder.")
-                except requests.exceptions.RequestException as e: st.error(f"🌐 Erro de comunicação com o servidor: {e}")
-                except json.JSONDecodeError as e: st.error(f"❌ Erro ao processar JSON da fatura: {e}")
-                except Exception as e: st.error(f"❌ Erro inesperado ao processar a fatura: {str(e)}")
-        # If it's the same file, do nothing to prevent reprocessing, data is already in session_state
+    restore_extraction_jobs()
+    if processing_mode == "Fatura única":
+        st.header("📤 Upload da Fatura")
+        if not st.session_state.uploaded_pdf:
+            st.info("👆 Carregue um ficheiro PDF com a fatura para começar o processamento.")
+        
+        uploaded_file = st.file_uploader("Selecione o arquivo PDF da fatura", type=['pdf'], help="Apenas ficheiros PDF são aceites")
+
+        if uploaded_file is not None:
+            # Identifica o ficheiro pelo conteúdo (SHA-256), não pelo nome e tamanho
+            pdf_bytes = uploaded_file.getvalue()
+            new_file_identifier = pdf_digest(pdf_bytes)
+            if st.session_state.get("last_uploaded_file_identifier") != new_file_identifier:
+                st.session_state.last_uploaded_file_identifier = new_file_identifier # Store identifier of processed file
+                # A extração corre em segundo plano; o resultado é carregado quando o job terminar
+                submit_extraction_jobs([(uploaded_file.name, pdf_bytes)])
+            # If it's the same file, do nothing to prevent reprocessing, data is already in session_state
+    else:
+        st.header("📤 Upload de Lote de Faturas")
+        get_job_store().max_workers = batch_workers
+        uploaded_files = st.file_uploader("Selecione os arquivos PDF das faturas", type=['pdf'], accept_multiple_files=True,
+                                          help="Apenas ficheiros PDF são aceites")
+        if uploaded_files and st.button(f"🚀 Processar {len(uploaded_files)} faturas", type="primary"):
+            submit_extraction_jobs([(uploaded.name, uploaded.getvalue()) for uploaded in uploaded_files])
+            st.rerun()
+
+    batch = st.session_state.batch_results
+    if batch:
+        if any(item["status"] not in FINISHED_STATUSES for item in batch):
+            show_job_progress()
+        elif len(batch) > 1:
+            failed = sum(1 for item in batch if item["error"])
+            from_cache = sum(1 for item in batch if item["cached"])
+            slowest = max(item["seconds"] for item in batch)
+            started_at = st.session_state.get("batch_started_at", 0.0)
+            elapsed = max(item.get("finished_at") or started_at for item in batch) - started_at
+            st.info(f"📦 {len(batch)} faturas: {len(batch) - failed} extraídas ({from_cache} da cache), {failed} com erro. "
+                    f"Tempo total {elapsed:.1f} s (mais lenta: {slowest:.1f} s).")
+        for item in batch:
+            if item["error"]:
+                st.error(f"❌ {item['filename']}: {item['error']}")
+
+        reviewable = [index for index, item in enumerate(batch) if item["status"] in FINISHED_STATUSES and not item["error"]]
+        if len(reviewable) > 1:
+            current = st.session_state.batch_index if st.session_state.batch_index in reviewable else reviewable[0]
+            position = reviewable.index(current)
+            col_prev, col_select, col_next = st.columns([1, 6, 1])
+            with col_prev:
+                if st.button("⬅️", disabled=position == 0, use_container_width=True):
+                    select_batch_item(reviewable[position - 1])
+                    st.rerun()
+            with col_select:
+                chosen = st.selectbox("Fatura em revisão:", options=reviewable, index=position,
+                                      format_func=lambda index: f"{batch_item_icon(batch[index])} {batch[index]['filename']}",
+                                      label_visibility="collapsed")
+            with col_next:
+                if st.button("➡️", disabled=position == len(reviewable) - 1, use_container_width=True):
+                    select_batch_item(reviewable[position + 1])
+                    st.rerun()
+            if chosen != st.session_state.batch_index:
+                select_batch_item(chosen)
+                st.rerun()
 
     if st.session_state.invoice_data and st.session_state.uploaded_pdf:
         st.markdown("---")
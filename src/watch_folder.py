@@ -0,0 +1,288 @@
+"""Serviço que processa os PDFs deixados numa pasta partilhada (scanners, gateway de email).
+
+Cada PDF novo na pasta de entrada é extraído e validado assim que o ficheiro deixa
+de crescer, sem esperar por ninguém: as extrações correm num ExtractionJobStore
+(concorrência limitada, PDFs com o mesmo conteúdo extraídos uma só vez, cache de
+extrações). No fim, o PDF vai para a pasta "done" ou "failed", acompanhado de um
+<nome>.json com os dados extraídos e o resultado da validação.
+
+Com o pacote watchdog (pip install watchdog) a pasta é vigiada por inotify (ou o
+equivalente do sistema); sem ele, é lida de poll_interval em poll_interval segundos.
+
+Uso (a partir da pasta src, com o servidor ADK a correr):
+    python watch_folder.py /srv/faturas/entrada
+    python watch_folder.py entrada --done processadas --failed erros --workers 4
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from extraction import (APP_NAME, DEFAULT_BATCH_WORKERS, DEFAULT_POOL_MAXSIZE, DEFAULT_TIMEOUT,
+                        GZIP_REQUESTS, SERVER_URL, USER_ID, ADKClient, SessionManager)
+from extraction_cache import DEFAULT_CACHE_DIR, ExtractionCache, agent_fingerprint, prompt_fingerprint
+from extraction_jobs import JOB_DONE, ExtractionJobStore
+from invoice_validator import InvoiceValidator, normalize_extracted_data
+from process_batch import result_record
+from scheduler import scheduler_from_env
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+logger = logging.getLogger("watch_folder")
+
+SESSION_PREFIX = "watch"
+# Segundos sem alterações de tamanho/data para um ficheiro ser considerado completo
+DEFAULT_SETTLE_SECONDS = 2.0
+# Intervalo entre leituras da pasta sem watchdog (com watchdog, só como salvaguarda)
+DEFAULT_POLL_INTERVAL = 5.0
+WATCHDOG_RESCAN_INTERVAL = 60.0
+
+
+if WATCHDOG_AVAILABLE:
+    class _WakeUpHandler(FileSystemEventHandler):
+        """Acorda o ciclo do FolderWatcher a cada ficheiro criado, alterado ou movido para a pasta"""
+
+        def __init__(self, wakeup: threading.Event):
+            super().__init__()
+            self.wakeup = wakeup
+
+        def on_any_event(self, event):
+            if not event.is_directory:
+                self.wakeup.set()
+
+
+def unique_destination(directory: str, filename: str) -> str:
+    """Caminho em directory para filename, com sufixo numérico se já existir um ficheiro com esse nome"""
+    base, extension = os.path.splitext(filename)
+    destination = os.path.join(directory, filename)
+    counter = 1
+    while os.path.exists(destination) or os.path.exists(destination + ".json"):
+        destination = os.path.join(directory, f"{base}-{counter}{extension}")
+        counter += 1
+    return destination
+
+
+class FolderWatcher:
+    """Vigia a pasta de entrada, submete os PDFs completos e arruma-os quando terminam"""
+
+    def __init__(self, inbox: str, done_dir: str, failed_dir: str, jobs: ExtractionJobStore,
+                 settle_seconds: float = DEFAULT_SETTLE_SECONDS, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 use_watchdog: bool = True):
+        self.inbox = inbox
+        self.done_dir = done_dir
+        self.failed_dir = failed_dir
+        self.jobs = jobs
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_watchdog = use_watchdog and WATCHDOG_AVAILABLE
+        self.processed = 0
+        self.failed = 0
+        for directory in (inbox, done_dir, failed_dir):
+            os.makedirs(directory, exist_ok=True)
+        # Ficheiros ainda a ser escritos: caminho -> (tamanho, mtime, visto assim desde)
+        self._candidates: Dict[str, Tuple[int, float, float]] = {}
+        # Ficheiros submetidos: caminho -> ID do job
+        self._submitted: Dict[str, str] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    def scan(self) -> int:
+        """Lê a pasta de entrada e submete os PDFs que já não estão a ser escritos; retorna quantos"""
+        now = time.monotonic()
+        seen = set()
+        submitted = 0
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith('.pdf'):
+                    continue
+                path = entry.path
+                seen.add(path)
+                if path in self._submitted:
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime)
+                previous = self._candidates.get(path)
+                if previous is None or previous[:2] != signature:
+                    self._candidates[path] = signature + (now,)
+                elif stat.st_size > 0 and now - previous[2] >= self.settle_seconds:
+                    if self._submit(path):
+                        submitted += 1
+        # Ficheiros removidos ou renomeados por outros antes de estarem completos
+        for path in list(self._candidates):
+            if path not in seen:
+                del self._candidates[path]
+        return submitted
+
+    def _submit(self, path: str) -> bool:
+        del self._candidates[path]
+        try:
+            with open(path, 'rb') as f:
+                pdf_bytes = f.read()
+        except OSError as e:
+            logger.warning("Não foi possível ler %s: %s", path, e)
+            return False
+        self._submitted[path] = self.jobs.submit(os.path.basename(path), pdf_bytes)
+        logger.info("Na fila: %s", path)
+        return True
+
+    def collect(self) -> int:
+        """Valida os jobs terminados e move os respetivos PDFs para done/failed; retorna quantos"""
+        finished = []
+        for path, job_id in list(self._submitted.items()):
+            job = self.jobs.get(job_id)
+            if job is None:
+                # Esquecido pelo job store (não devia acontecer enquanto o PDF está na pasta): volta a submeter
+                del self._submitted[path]
+            elif job.finished:
+                finished.append((path, job))
+        if not finished:
+            return 0
+
+        successful = [(path, job, normalize_extracted_data(job.data)) for path, job in finished
+                      if job.status == JOB_DONE]
+        validated = InvoiceValidator.validate_many([invoice_data for _, _, invoice_data in successful])
+        results_by_path = {path: (invoice_data, results)
+                           for (path, _, invoice_data), results in zip(successful, validated)}
+
+        for path, job in finished:
+            invoice_data, results = results_by_path.get(path, (None, None))
+            extraction = {"data": job.data, "error": job.error, "seconds": job.seconds, "cached": job.cached}
+            self._archive(path, result_record(os.path.basename(path), extraction, invoice_data, results),
+                          failed=results is None)
+            del self._submitted[path]
+        return len(finished)
+
+    def _archive(self, path: str, record: Dict[str, Any], failed: bool) -> None:
+        directory = self.failed_dir if failed else self.done_dir
+        destination = unique_destination(directory, os.path.basename(path))
+        try:
+            shutil.move(path, destination)
+        except OSError as e:
+            # Fica na entrada e será processado de novo (a cache evita nova chamada ao LLM)
+            logger.error("Não foi possível mover %s para %s: %s", path, directory, e)
+            return
+        with open(destination + ".json", 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        if failed:
+            self.failed += 1
+            logger.warning("Falhou: %s (%s)", path, record["error"])
+        else:
+            self.processed += 1
+            logger.info("Concluído: %s -> %s (%s)", path, destination, record["status"])
+
+    def run_once(self) -> None:
+        self.scan()
+        self.collect()
+
+    def run(self) -> None:
+        """Ciclo principal, até stop() ser chamado"""
+        observer = None
+        if self.use_watchdog:
+            observer = Observer()
+            observer.schedule(_WakeUpHandler(self._wakeup), self.inbox, recursive=False)
+            observer.start()
+        logger.info("A vigiar %s (%s)", self.inbox, "watchdog" if observer is not None else "polling")
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                self._wakeup.wait(self._next_wait(observer is not None))
+                self._wakeup.clear()
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+    def _next_wait(self, watching: bool) -> float:
+        # Ficheiros a assentar ou jobs a correr precisam de nova verificação em breve
+        if self._candidates:
+            return min(self.settle_seconds, self.poll_interval)
+        if self._submitted:
+            return min(1.0, self.poll_interval)
+        return WATCHDOG_RESCAN_INTERVAL if watching else self.poll_interval
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "settling": len(self._candidates),
+            "in_progress": len(self._submitted),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Extrai e valida os PDFs que chegam a uma pasta")
+    parser.add_argument("inbox", help="pasta de entrada a vigiar")
+    parser.add_argument("--done", help="pasta dos PDFs processados (por omissão <inbox>/done)")
+    parser.add_argument("--failed", help="pasta dos PDFs com erro (por omissão <inbox>/failed)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS,
+                        help=f"extrações em simultâneo (máximo {DEFAULT_POOL_MAXSIZE})")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="segundos sem alterações até um ficheiro ser considerado completo")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="intervalo entre leituras da pasta sem watchdog (segundos)")
+    parser.add_argument("--polling", action="store_true", help="não usar o watchdog mesmo que esteja instalado")
+    parser.add_argument("--rpm", type=float,
+                        help="máximo de pedidos por minuto ao modelo (por omissão ADK_REQUESTS_PER_MINUTE, ou sem limite)")
+    parser.add_argument("--max-queue", type=int,
+                        help="máximo de extrações à espera de lugar; as restantes falham logo "
+                             "(por omissão ADK_MAX_QUEUE, ou sem limite)")
+    parser.add_argument("--server-url", default=SERVER_URL, help="URL do servidor ADK")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="timeout de cada pedido (segundos)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="pasta da cache de extrações")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    workers = min(max(1, args.workers), DEFAULT_POOL_MAXSIZE)
+    client = ADKClient(args.server_url, APP_NAME, USER_ID, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                       gzip_requests=GZIP_REQUESTS, timeout=args.timeout,
+                       scheduler=scheduler_from_env(workers, args.rpm, args.max_queue))
+    try:
+        client.check_connection()
+    except requests.exceptions.RequestException as e:
+        logger.error("Não foi possível ligar ao servidor ADK (%s): %s", args.server_url, e)
+        return 2
+
+    sessions = SessionManager(client, prefix=SESSION_PREFIX, measure_context=False)
+    cache = ExtractionCache(args.cache_dir, prompt=prompt_fingerprint(), model_version=agent_fingerprint())
+    jobs = ExtractionJobStore(sessions, max_workers=workers, cache=cache)
+    watcher = FolderWatcher(args.inbox, args.done or os.path.join(args.inbox, "done"),
+                            args.failed or os.path.join(args.inbox, "failed"), jobs,
+                            settle_seconds=args.settle, poll_interval=args.poll_interval,
+                            use_watchdog=not args.polling)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: watcher.stop())
+    try:
+        watcher.run()
+    finally:
+        # Só os jobs em curso terminam; os PDFs dos restantes ficam na entrada e são retomados
+        # no próximo arranque
+        jobs.shutdown(wait=True, cancel_futures=True)
+        watcher.collect()
+        client.close()
+    logger.info("Terminado: %s", watcher.stats())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())